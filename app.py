@@ -1,7 +1,7 @@
 import streamlit as st
-from transformers import pipeline
-import nltk
-import arxiv
+from arxiv_service import get_arxiv_service
+from utils import show_paper_details, start_warm_up
+from metrics import OPERATOR_MODE, start_metrics_server, start_trace
 
 # Initialize session state
 if 'papers' not in st.session_state:
@@ -10,14 +10,36 @@ if 'selected_paper' not in st.session_state:
     st.session_state.selected_paper = None
 if 'abstract_summary' not in st.session_state:
     st.session_state.abstract_summary = None
+if 'abstract_summaries' not in st.session_state:
+    st.session_state.abstract_summaries = {}
 if 'paper_summary' not in st.session_state:
     st.session_state.paper_summary = None
+if 'prefetch_batch' not in st.session_state:
+    st.session_state.prefetch_batch = None
+if 'search_pager' not in st.session_state:
+    st.session_state.search_pager = None
+if 'page_number' not in st.session_state:
+    st.session_state.page_number = 0
+if 'paper_summary_job' not in st.session_state:
+    st.session_state.paper_summary_job = None
+if 'answer' not in st.session_state:
+    st.session_state.answer = None
+if 'answer_job' not in st.session_state:
+    st.session_state.answer_job = None
+if 'paper_context' not in st.session_state:
+    st.session_state.paper_context = None
+if 'local_papers' not in st.session_state:
+    st.session_state.local_papers = []
 
-# Download nltk data (if needed)
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt")
+# Load the summarization model and other heavy dependencies in the background
+# (nltk data is downloaded there too, if needed)
+start_warm_up()
+
+# Serve Prometheus metrics (if a port is configured), once per process
+@st.cache_resource
+def metrics_server():
+    return start_metrics_server()
+metrics_server()
 
 # Sidebar how it works section
 st.sidebar.title("How it works")
@@ -25,6 +47,7 @@ st.sidebar.title("How it works")
 # Explanation of the paper search
 with st.sidebar.expander("**Paper Search**"):
     st.markdown("The paper search uses the arXiv API to search for papers based on a search query and selected categories, \"arXiv is a free distribution service and an open-access archive for nearly 2.4 million scholarly articles in the fields of physics, mathematics, computer science, quantitative biology, quantitative finance, statistics, electrical engineering and systems science, and economics.\"")
+    st.markdown("Papers someone has already opened here are kept in a local full-text index as well. They are listed first and open instantly, and \"Only papers we already have\" searches just those without asking arXiv.")
     st.link_button("Learn more about arXiv",
                    "https://info.arxiv.org/about/index.html")
 
@@ -40,9 +63,7 @@ with st.sidebar.expander("**Abstract Summary**"):
     )
     # Button to take user to paper details page of the original BART paper
     if st.button("Read the BART paper"):
-        search = arxiv.Search(id_list=["1910.13461"])
-        st.session_state.selected_paper = next(search.results())
-        st.switch_page("paper_details_page.py")
+        show_paper_details(get_arxiv_service().get_paper("1910.13461"))
 
 # Explanation of the paper summary feature
 with st.sidebar.expander("**Paper Summary**"):
@@ -58,9 +79,7 @@ with st.sidebar.expander("**Paper Summary**"):
     st.link_button("Learn more about Gemini 2.0", "https://blog.google/technology/google-deepmind/google-gemini-ai-update-december-2024/#gemini-2-0")
     # Button to take user to paper details page of the gemini 1.5 paper
     if st.button("Read the Gemini 1.5 paper"):
-        search = arxiv.Search(id_list=["2403.05530"])
-        st.session_state.selected_paper = next(search.results())
-        st.switch_page("paper_details_page.py")
+        show_paper_details(get_arxiv_service().get_paper("2403.05530"))
 
 with st.sidebar.expander("**Ask Questions**"):
     st.markdown(
@@ -73,9 +92,7 @@ with st.sidebar.expander("**Ask Questions**"):
     st.link_button("Learn more about Gemini 2.0", "https://blog.google/technology/google-deepmind/google-gemini-ai-update-december-2024/#gemini-2-0")
     # Button to take user to paper details page of the gemini 1.5 paper
     if st.button("Read the Gemini 1.5 paper", key="ask_questions_button"):
-        search = arxiv.Search(id_list=["2403.05530"])
-        st.session_state.selected_paper = next(search.results())
-        st.switch_page("paper_details_page.py")
+        show_paper_details(get_arxiv_service().get_paper("2403.05530"))
 
 
 # Define pages
@@ -85,4 +102,25 @@ paper_details_page = st.Page("paper_details_page.py")
 # Define nav and hide it
 pg = st.navigation([search_page, paper_details_page], position="hidden")
 
+# Record how long each pipeline stage takes during this run
+trace = start_trace()
+
 pg.run()
+
+# Per-request timing breakdown for operators
+if OPERATOR_MODE and trace:
+    with st.sidebar.expander("**Timing breakdown**", expanded=True):
+        st.dataframe(
+            [
+                {
+                    "stage": event["stage"],
+                    "seconds": round(event["seconds"], 3),
+                    "cache": event.get("cache", ""),
+                    "bytes": event.get("bytes"),
+                    "tokens": event.get("tokens"),
+                }
+                for event in trace
+            ],
+            hide_index=True,
+        )
+        st.caption(f"Total {sum(event['seconds'] for event in trace):.2f}s across {len(trace)} stages")
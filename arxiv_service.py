@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import arxiv
+import streamlit as st
+
+from metrics import stage
+from paper_record import PaperRecord
+
+# Point the client at another Atom feed server, e.g. a local fake one for tests
+ARXIV_API_URL = os.environ.get("PAPER_DISTILL_ARXIV_API_URL")
+# Pause between API requests, arXiv asks for at least 3 seconds but a local server doesn't need one
+ARXIV_DELAY_SECONDS = float(os.environ.get("PAPER_DISTILL_ARXIV_DELAY_SECONDS", 3.0))
+# How long search results and id lookups are served from the cache
+SEARCH_TTL_SECONDS = int(os.environ.get("PAPER_DISTILL_SEARCH_TTL", 600))
+ID_TTL_SECONDS = int(os.environ.get("PAPER_DISTILL_ID_TTL", 24 * 3600))
+MAX_CACHE_ENTRIES = 512
+# Furthest a paginated search can be followed with "load more"
+MAX_PAGINATED_RESULTS = int(os.environ.get("PAPER_DISTILL_MAX_PAGINATED_RESULTS", 1000))
+
+# arxiv.Client's own default number of results per request
+DEFAULT_PAGE_SIZE = 100
+
+# arXiv's boolean operators are case sensitive, everything else in a query isn't
+OPERATORS = {"AND", "OR", "ANDNOT"}
+
+
+def normalize_query(query):
+    words = (query or "").split()
+    return " ".join(word if word in OPERATORS else word.lower() for word in words)
+
+
+def build_query(query, categories):
+    # Add categories to query if there are any
+    if categories:
+        cat_query = " OR ".join([f"cat:{cat}" for cat in categories])
+        query = f"{query} AND ({cat_query})" if query else cat_query
+    return query
+
+
+class SearchPager:
+    # Pulls a search's results lazily from the client generator one page at a time,
+    # keeping every page it has fetched so going back to one is free
+
+    def __init__(self, service, search, page_size):
+        self.service = service
+        self.search = search
+        self.page_size = page_size
+        self.pages = []
+        self.exhausted = False
+        self.results = None
+        self.lock = threading.Lock()
+
+    def page(self, number):
+        with stage("search", page=number) as event, self.lock:
+            event["cache"] = "hit" if number < len(self.pages) else "miss"
+            while len(self.pages) <= number and not self.exhausted:
+                page, self.exhausted = self.service._next_page(self, self.page_size)
+                if page:
+                    self.pages.append(page)
+            results = list(self.pages[number]) if number < len(self.pages) else []
+            event["results"] = len(results)
+            return results
+
+    def has_page(self, number):
+        return number < len(self.pages) or not self.exhausted
+
+
+class ArxivService:
+    # One paced arXiv client for the whole process with a TTL cache in front of it
+
+    def __init__(self):
+        self.client = arxiv.Client(delay_seconds=ARXIV_DELAY_SECONDS)
+        if ARXIV_API_URL:
+            self.client.query_url_format = ARXIV_API_URL + "?{}"
+        # The client waits between requests to respect arXiv's rate limit but isn't thread safe
+        self.client_lock = threading.Lock()
+        self.cache = {}
+        self.in_flight = {}
+        self.cache_lock = threading.Lock()
+
+    def _fetch(self, search):
+        with self.client_lock:
+            self.client.page_size = DEFAULT_PAGE_SIZE
+            # Results are slimmed down to records straight away, they are what the cache and the sessions hold
+            return [PaperRecord.from_result(result) for result in self.client.results(search)]
+
+    def _next_page(self, pager, page_size):
+        with self.client_lock:
+            # The client reads its page size before each request, so one API call returns exactly one page
+            self.client.page_size = page_size
+            if pager.results is None:
+                # Resume after the pages already fetched, e.g. when a failed request ended the last generator
+                offset = sum(len(page) for page in pager.pages)
+                pager.results = self.client.results(pager.search, offset=offset)
+            # The client skips entries it can't parse, so a short page doesn't mean the feed has ended,
+            # only the generator running out does. Returns the page and whether the feed has ended
+            page = []
+            try:
+                for result in pager.results:
+                    page.append(PaperRecord.from_result(result))
+                    if len(page) == page_size:
+                        return page, False
+            except Exception:
+                pager.results = None
+                raise
+            return page, True
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self.cache.items() if expires <= now]:
+            del self.cache[key]
+        # Drop the entries closest to expiring once the cache is full
+        if len(self.cache) > MAX_CACHE_ENTRIES:
+            for key in sorted(self.cache, key=lambda k: self.cache[k][0])[: len(self.cache) - MAX_CACHE_ENTRIES]:
+                del self.cache[key]
+
+    def _cached(self, key, ttl, fetch):
+        with stage("search") as event:
+            results = self._cached_results(key, ttl, fetch, event)
+            event["results"] = len(results)
+            return results
+
+    def _cached_results(self, key, ttl, fetch, event):
+        with self.cache_lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                event["cache"] = "hit"
+                return list(entry[1])
+            # Identical requests already in flight share its result rather than hitting the API again
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.in_flight[key] = future
+        if not owner:
+            event["cache"] = "coalesced"
+            return list(future.result())
+
+        event["cache"] = "miss"
+        try:
+            results = fetch()
+        except BaseException as e:
+            with self.cache_lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.cache_lock:
+            del self.in_flight[key]
+            self.cache[key] = (time.monotonic() + ttl, results)
+            self._prune()
+        future.set_result(results)
+        return list(results)
+
+    def search(self, query, categories, max_results=10):
+        key = ("search", normalize_query(query), tuple(sorted(set(categories or []))), max_results)
+        search = arxiv.Search(
+            query=build_query(query, categories), max_results=max_results, sort_by=arxiv.SortCriterion.SubmittedDate
+        )
+        return self._cached(key, SEARCH_TTL_SECONDS, lambda: self._fetch(search))
+
+    def paginate(self, query, categories, page_size=10):
+        # Pagers are shared between sessions for the search TTL, so a popular search's pages are only fetched once
+        key = ("pages", normalize_query(query), tuple(sorted(set(categories or []))), page_size)
+        with self.cache_lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+            search = arxiv.Search(
+                query=build_query(query, categories),
+                max_results=MAX_PAGINATED_RESULTS,
+                sort_by=arxiv.SortCriterion.SubmittedDate,
+            )
+            pager = SearchPager(self, search, page_size)
+            self.cache[key] = (time.monotonic() + SEARCH_TTL_SECONDS, pager)
+            self._prune()
+        return pager
+
+    def get_papers(self, ids):
+        key = ("ids", tuple(ids))
+        return self._cached(key, ID_TTL_SECONDS, lambda: self._fetch(arxiv.Search(id_list=list(ids))))
+
+    def get_paper(self, paper_id):
+        results = self.get_papers([paper_id])
+        if not results:
+            raise LookupError(f"No arXiv paper with id {paper_id}")
+        return results[0]
+
+
+# One service per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def get_arxiv_service():
+    return ArxivService()
@@ -0,0 +1,126 @@
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import streamlit as st
+
+from metrics import stage
+from result_cache import get_result_cache, make_key
+from token_budget import fit_to_token_budget, model_input_budget, summary_length_bounds, tokenizer_counter
+from utils import SUMMARIZER_BACKEND, SUMMARIZER_MODEL, load_summarizer
+
+# Abstracts per forward pass, batches are padded to their longest abstract
+MAX_BATCH_SIZE = 8
+# How long the batcher waits for other sessions' requests to join a batch
+MAX_WAIT_SECONDS = 0.02
+# Most requests taken off the queue in one go, enough for a full page of results
+MAX_QUEUE_DRAIN = 64
+# Summary lengths are rounded to this many tokens so requests of similar length share a forward pass
+LENGTH_BUCKET = 20
+
+
+def prepare_abstract(abstract, length, tokenizer):
+    # Pack whole sentences up to the model's exact token limit, measured with its own tokenizer
+    with stage("tokenize") as event:
+        abstract, input_tokens = fit_to_token_budget(
+            abstract, model_input_budget(tokenizer), tokenizer_counter(tokenizer)
+        )
+        event["tokens"] = input_tokens
+    # Convert length from percentage of the abstract into min and max summary lengths in tokens
+    min_length, max_length = summary_length_bounds(input_tokens, length, bucket=LENGTH_BUCKET)
+    return abstract, min_length, max_length
+
+
+class MicroBatcher:
+    # Collects summarization requests from every session and runs them through the model together
+
+    def __init__(self, summarizer):
+        self.summarizer = summarizer
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, name="abstract-batcher", daemon=True).start()
+
+    def submit(self, text, min_length, max_length):
+        future = Future()
+        self.requests.put((text, min_length, max_length, future))
+        return future
+
+    def _collect(self):
+        # Block for the first request, then give others a short window to join it
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + MAX_WAIT_SECONDS
+        while len(batch) < MAX_QUEUE_DRAIN:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Generation lengths apply to the whole call, so group requests that share them
+            groups = {}
+            for request in self._collect():
+                groups.setdefault((request[1], request[2]), []).append(request)
+
+            for (min_length, max_length), group in groups.items():
+                # Sorting by length keeps the padding inside each batch small
+                group.sort(key=lambda request: len(request[0]))
+                try:
+                    with stage("local_inference_batch", batch=len(group)):
+                        outputs = self.summarizer(
+                            [request[0] for request in group],
+                            max_length=max_length,
+                            min_length=min_length,
+                            do_sample=False,
+                            batch_size=MAX_BATCH_SIZE,
+                        )
+                except Exception as e:
+                    for request in group:
+                        request[3].set_exception(e)
+                    continue
+                for request, output in zip(group, outputs):
+                    request[3].set_result(output["summary_text"])
+
+
+# One batcher per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def load_batcher():
+    return MicroBatcher(load_summarizer())
+
+
+def abstract_cache_key(abstract, length):
+    # Keyed by the abstract's content, so the same abstract shares a summary across papers and sessions
+    return make_key(
+        "abstract_summary",
+        abstract=hashlib.sha256(abstract.encode("utf-8")).hexdigest(),
+        model=SUMMARIZER_MODEL,
+        backend=SUMMARIZER_BACKEND,
+        length=length,
+        bucket=LENGTH_BUCKET,
+    )
+
+
+def summarize_abstracts(abstracts, length):
+    cache = get_result_cache()
+    keys = [abstract_cache_key(abstract, length) for abstract in abstracts]
+    summaries = [cache.get(key) for key in keys]
+
+    # Queue every abstract that wasn't cached at once so they are batched together, then wait for all of them
+    with stage("local_inference", abstracts=len(abstracts)) as event:
+        batcher = load_batcher()
+        tokenizer = batcher.summarizer.tokenizer
+        futures = {
+            i: batcher.submit(*prepare_abstract(abstracts[i], length, tokenizer))
+            for i, summary in enumerate(summaries)
+            if summary is None
+        }
+        event["cached"] = len(abstracts) - len(futures)
+        for i, future in futures.items():
+            summaries[i] = future.result()
+            cache.put(keys[i], summaries[i])
+    return summaries
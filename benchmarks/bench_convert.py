@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pymupdf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_convert import CONVERT_WORKERS, convert_pdf_to_markdown  # noqa: E402
+
+
+def time_conversion(pdf_path, workers, repeats):
+    best = None
+    markdown = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        markdown = convert_pdf_to_markdown(pdf_path, workers=workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, markdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and page-sharded pdf to markdown conversion")
+    parser.add_argument("pdf", help="Path to a (long) paper pdf, its first N pages are used for each run")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 10, 20, 40, 80])
+    parser.add_argument("--workers", type=int, default=CONVERT_WORKERS)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    source = pymupdf.open(args.pdf)
+    print(f"workers={args.workers}")
+    print(f"{'pages':>6} {'serial s':>10} {'parallel s':>11} {'speedup':>8} {'identical':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            if pages > source.page_count:
+                break
+            # Build a document with just the first `pages` pages of the source paper
+            path = os.path.join(tmp, f"paper_{pages}.pdf")
+            doc = pymupdf.open()
+            doc.insert_pdf(source, from_page=0, to_page=pages - 1)
+            doc.save(path)
+            doc.close()
+
+            # Warm the pool up once so worker start up isn't counted against the first run
+            convert_pdf_to_markdown(path, workers=args.workers)
+
+            serial, serial_md = time_conversion(path, 1, args.repeats)
+            parallel, parallel_md = time_conversion(path, args.workers, args.repeats)
+            print(f"{pages:>6} {serial:>10.2f} {parallel:>11.2f} {serial / parallel:>7.2f}x {str(serial_md == parallel_md):>10}")
+
+
+if __name__ == "__main__":
+    main()
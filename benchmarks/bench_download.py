@@ -0,0 +1,78 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from downloader import Downloader  # noqa: E402
+from stubs import ArxivCorpus, start_arxiv_stub  # noqa: E402
+
+
+def download_all(downloader, urls, directory, threads, revalidate=False):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(
+            lambda item: downloader.download(item[1], os.path.join(directory, f"{item[0]}.pdf"), revalidate),
+            enumerate(urls),
+        ))
+    return time.perf_counter() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the pdf downloader against the local arXiv stub")
+    parser.add_argument("--papers", type=int, default=16)
+    parser.add_argument("--page-counts", type=int, nargs="+", default=[12, 24, 48])
+    parser.add_argument("--threads", type=int, default=8, help="Callers downloading at once")
+    parser.add_argument("--concurrency", type=int, default=4, help="The downloader's global download limit")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the stub waits before each response")
+    parser.add_argument("--bandwidth", type=int, default=2 * 1024 ** 2, help="Bytes per second for the limited run")
+    args = parser.parse_args()
+
+    corpus = ArxivCorpus(args.papers, args.page_counts)
+    total_bytes = sum(len(corpus.pdf(entry_id)) for entry_id in corpus.ids())
+    print(f"papers={args.papers} total={total_bytes / 1024 ** 2:.1f} MiB threads={args.threads} concurrency={args.concurrency}")
+    print(f"{'run':>22} {'seconds':>8} {'MiB/s':>7} {'transferred MiB':>16} {'resumed MiB':>12} {'requests':>9}")
+
+    # Correctness of each of these runs is covered by tests/test_downloader.py, this only reports their cost
+    def report(name, elapsed, results):
+        transferred = sum(result["bytes"] for result in results)
+        resumed = sum(result["resumed"] for result in results)
+        requests = sum(result["requests"] for result in results)
+        print(
+            f"{name:>22} {elapsed:>8.2f} {transferred / 1024 ** 2 / elapsed:>7.2f} {transferred / 1024 ** 2:>16.2f} "
+            f"{resumed / 1024 ** 2:>12.2f} {requests:>9}"
+        )
+
+    # Cold downloads over the pooled connections
+    server = start_arxiv_stub(corpus, args.latency)
+    urls = [f"{server.base_url}/pdf/{entry_id}" for entry_id in corpus.ids()]
+    with tempfile.TemporaryDirectory() as directory:
+        downloader = Downloader(args.concurrency)
+        report("cold", *download_all(downloader, urls, directory, args.threads))
+        # Everything is unchanged, so revalidation only costs a conditional request per file
+        report("revalidate", *download_all(downloader, urls, directory, args.threads, revalidate=True))
+    server.shutdown()
+
+    # Every download's connection drops partway through the first time, the downloader resumes it with a
+    # range request, so each file takes two requests and the second only asks for what is still missing
+    smallest = min(len(corpus.pdf(entry_id)) for entry_id in corpus.ids())
+    server = start_arxiv_stub(corpus, args.latency, drop_after=smallest // 2)
+    urls = [f"{server.base_url}/pdf/{entry_id}" for entry_id in corpus.ids()]
+    with tempfile.TemporaryDirectory() as directory:
+        report("dropped connections", *download_all(Downloader(args.concurrency), urls, directory, args.threads))
+    server.shutdown()
+
+    # The same downloads held to the bandwidth limit across all threads
+    server = start_arxiv_stub(corpus, args.latency)
+    urls = [f"{server.base_url}/pdf/{entry_id}" for entry_id in corpus.ids()]
+    with tempfile.TemporaryDirectory() as directory:
+        downloader = Downloader(args.concurrency, bytes_per_second=args.bandwidth)
+        report(f"limited {args.bandwidth / 1024 ** 2:.1f} MiB/s", *download_all(downloader, urls, directory, args.threads))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+import argparse
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import ArxivCorpus, start_arxiv_stub, start_genai_stub  # noqa: E402
+
+QUESTION = "What is the main contribution and how is it evaluated?"
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def peak_rss_mib():
+    # Linux reports kilobytes, pdf conversion runs in child processes so both are counted
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / 1024
+
+
+class Report:
+
+    def __init__(self):
+        self.rows = []
+
+    def measure(self, name, fn, items, unit="call"):
+        # Run fn once per item and keep each latency, python heap peak is traced across the whole stage
+        latencies = []
+        tracemalloc.start()
+        start = time.perf_counter()
+        for item in items:
+            call_start = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - call_start)
+        elapsed = time.perf_counter() - start
+        heap_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.rows.append({
+            "name": name,
+            "count": len(latencies),
+            "throughput": f"{len(latencies) / elapsed:.2f} {unit}/s" if elapsed else "-",
+            "p50": percentile(latencies, 0.5) if latencies else 0.0,
+            "p95": percentile(latencies, 0.95) if latencies else 0.0,
+            "heap": heap_peak / 1024 ** 2,
+            "rss": peak_rss_mib(),
+        })
+
+    def latencies(self, name, latencies):
+        # Latencies collected inside another stage, throughput and memory belong to that stage
+        self.rows.append({
+            "name": name,
+            "count": len(latencies),
+            "throughput": "-",
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "heap": None,
+            "rss": None,
+        })
+
+    def skip(self, name, reason):
+        self.rows.append({"name": name, "skipped": reason})
+
+    def print(self):
+        print(f"{'stage':>28} {'n':>4} {'throughput':>14} {'p50 s':>8} {'p95 s':>8} {'heap MiB':>9} {'rss MiB':>8}")
+        for row in self.rows:
+            if "skipped" in row:
+                print(f"{row['name']:>28} skipped: {row['skipped']}")
+                continue
+            heap = "-" if row["heap"] is None else f"{row['heap']:.1f}"
+            rss = "-" if row["rss"] is None else f"{row['rss']:.1f}"
+            print(
+                f"{row['name']:>28} {row['count']:>4} {row['throughput']:>14} {row['p50']:>8.3f} {row['p95']:>8.3f} "
+                f"{heap:>9} {rss:>8}"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each pipeline stage and the end-to-end flows against local arXiv and Gemini stand-ins"
+    )
+    parser.add_argument("--papers", type=int, default=12, help="Papers in the stub corpus")
+    parser.add_argument("--page-counts", type=int, nargs="+", default=[4, 12, 24], help="Pages of the generated pdfs")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs of the search and question stages")
+    parser.add_argument("--arxiv-latency", type=float, default=0.0, help="Seconds the arXiv stub waits per request")
+    parser.add_argument("--first-token", type=float, default=0.3, help="Seconds before the fake Gemini's first chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.05, help="Seconds between streamed chunks")
+    parser.add_argument("--skip-local", action="store_true", help="Skip the stages that need the local summarizer")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    corpus = ArxivCorpus(args.papers, args.page_counts)
+    arxiv_stub = start_arxiv_stub(corpus, args.arxiv_latency)
+    genai_stub = start_genai_stub(args.first_token, args.chunk_delay)
+    workdir = tempfile.mkdtemp(prefix="paper_distill_bench_")
+
+    # The app reads its configuration when its modules are imported, so this has to come first
+    os.environ.update(
+        PAPER_DISTILL_ARXIV_API_URL=f"{arxiv_stub.base_url}/api/query",
+        PAPER_DISTILL_ARXIV_DELAY_SECONDS="0",
+        PAPER_DISTILL_GEMINI_BASE_URL=genai_stub.base_url,
+        PAPER_DISTILL_EMBEDDING_URL=f"{genai_stub.base_url}/embed",
+        PAPER_DISTILL_CACHE_DIR=os.path.join(workdir, "papers"),
+        PAPER_DISTILL_RESULT_CACHE=os.path.join(workdir, "results.sqlite"),
+    )
+
+    import distill_cli
+    import paper_cache
+    from arxiv_service import ArxivService
+    from gemini_client import (
+        GEMINI_MODEL,
+        QUESTION_CONTEXT,
+        QUESTION_INSTRUCTION,
+        generate_paper_summary,
+        get_genai_client,
+        get_paper_context,
+    )
+    from jobs import submit_question
+    from paper_index import top_chunks
+    from result_cache import get_result_cache
+
+    def clear_results():
+        with get_result_cache()._connect() as db:
+            db.execute("DELETE FROM results")
+
+    def clear_papers():
+        shutil.rmtree(paper_cache.CACHE_DIR, ignore_errors=True)
+
+    report = Report()
+    client = get_genai_client("bench")
+    repeats = range(args.repeats)
+
+    try:
+        # Search, a fresh service has an empty cache so every call goes to the stub
+        report.measure("search cold", lambda _: ArxivService().search("summarization", [], args.papers), repeats)
+        service = ArxivService()
+        report.measure("search cached", lambda _: service.search("summarization", [], args.papers), repeats)
+        report.measure(
+            "paginate page",
+            lambda number: service.paginate("summarization", [], 2).page(number),
+            range(max(1, args.papers // 2)),
+            "page",
+        )
+        papers = service.search("summarization", [], args.papers)
+
+        # Download and conversion, cold from an empty artifact cache then served from it
+        report.measure("download cold", paper_cache.get_pdf_path, papers, "paper")
+        report.measure("convert cold", paper_cache.get_markdown, papers, "paper")
+        report.measure("download+convert warm", paper_cache.get_markdown, papers, "paper")
+        markdowns = {paper_cache.paper_key(paper): paper_cache.get_markdown(paper) for paper in papers}
+
+        if args.skip_local:
+            report.skip("abstract summaries", "--skip-local")
+            report.skip("local paper summary", "--skip-local")
+        else:
+            from batch_summarizer import summarize_abstracts
+            from local_summary import summarize_paper_locally
+
+            clear_results()
+            report.measure(
+                "abstract summaries", lambda paper: summarize_abstracts([paper.summary], 50), papers, "abstract"
+            )
+            report.measure(
+                "abstract summaries batched",
+                lambda length: summarize_abstracts([paper.summary for paper in papers], length),
+                [40, 60],
+                "batch",
+            )
+            report.measure(
+                "local paper summary",
+                lambda paper: summarize_paper_locally(paper_cache.paper_key(paper), markdowns[paper_cache.paper_key(paper)], 3),
+                papers[:2],
+                "paper",
+            )
+
+        # Paper summaries through the fake Gemini, then served from the result cache
+        clear_results()
+
+        def gemini_summary(paper):
+            key = paper_cache.paper_key(paper)
+            return generate_paper_summary(client, key, markdowns[key], 3, "Graduate")
+
+        report.measure("paper summary cold", gemini_summary, papers, "paper")
+        report.measure("paper summary cached", gemini_summary, papers, "paper")
+
+        report.measure(
+            "paper context",
+            lambda paper: get_paper_context(
+                client, paper_cache.paper_key(paper), lambda: markdowns[paper_cache.paper_key(paper)]
+            ),
+            papers,
+            "paper",
+        )
+
+        # Questions, retrieval over the paper index and a streamed answer, timed to the first chunk and to the end
+        from google.genai import types
+
+        first_tokens = []
+
+        def answer(paper):
+            excerpts = "\n\n".join(top_chunks(paper, markdowns[paper_cache.paper_key(paper)], QUESTION))
+            start = time.perf_counter()
+            stream = client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                config=types.GenerateContentConfig(system_instruction=QUESTION_INSTRUCTION),
+                contents=[QUESTION_CONTEXT.format(title=paper.title, abstract=paper.summary, excerpts=excerpts), QUESTION],
+            )
+            for i, _ in enumerate(stream):
+                if i == 0:
+                    first_tokens.append(time.perf_counter() - start)
+
+        report.measure("question (index cold)", answer, papers, "question")
+        report.measure("question (index warm)", answer, [papers[i % len(papers)] for i in repeats], "question")
+        report.latencies("question first chunk", first_tokens)
+
+        # Every paper's question submitted to the job queue at once, twice over so half of them are deduplicated,
+        # with the requests bounded by the queue's API concurrency limit
+        def question_jobs(_):
+            jobs = [submit_question(client, paper, QUESTION) for paper in papers * 2]
+            while not all(job.done for job in jobs):
+                time.sleep(0.01)
+
+        clear_results()
+        report.measure("question jobs", question_jobs, [0], "batch")
+
+        # End to end, a user searching, opening a paper, summarizing it and asking a question, all caches cold
+        def details_flow(paper):
+            ArxivService().search("summarization", [], args.papers)
+            markdown = paper_cache.get_markdown(paper)
+            generate_paper_summary(client, paper_cache.paper_key(paper), markdown, 3, "Graduate")
+            answer(paper)
+
+        clear_papers()
+        clear_results()
+        report.measure("flow: search to answer", details_flow, papers, "flow")
+
+        # End to end, the headless batch distiller over the whole corpus
+        def batch_flow(run):
+            output = os.path.join(workdir, f"distilled_{run}.jsonl")
+            cli_args = distill_cli.parse_args([
+                "--ids", *corpus.ids(), "--output", output, "--api-key", "bench", "--engine", "gemini",
+            ])
+            distill_cli.run(cli_args)
+
+        if args.skip_local:
+            report.skip("flow: batch distill", "--skip-local, abstracts need the local summarizer")
+        else:
+            clear_papers()
+            clear_results()
+            report.measure("flow: batch distill", batch_flow, [0], "run")
+    finally:
+        arxiv_stub.shutdown()
+        genai_stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"papers={args.papers} pages={args.page_counts} first_token={args.first_token}s chunk_delay={args.chunk_delay}s")
+    report.print()
+
+
+if __name__ == "__main__":
+    main()
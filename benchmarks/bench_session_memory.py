@@ -0,0 +1,65 @@
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+import arxiv
+import feedparser
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from paper_record import PaperRecord  # noqa: E402
+from stubs import ArxivCorpus  # noqa: E402
+
+
+def fetch_results(feed):
+    # Parse the feed the way arxiv.Client does, so every call returns a fresh set of objects
+    return [arxiv.Result._from_feed_entry(entry) for entry in feedparser.parse(feed).entries]
+
+
+def session_state(papers):
+    # The paper fields a search session keeps, the results page and the paper opened from it
+    return {"papers": list(papers), "selected_paper": papers[0]}
+
+
+def bytes_per_session(build, sessions):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [build() for _ in range(sessions)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del states
+    return (after - before) / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory each search session's results take")
+    parser.add_argument("--sessions", type=int, default=200, help="Concurrent sessions to simulate")
+    parser.add_argument("--page-sizes", type=int, nargs="+", default=[10, 25, 50])
+    args = parser.parse_args()
+
+    print(f"bytes per session, sessions={args.sessions}")
+    print(f"{'page size':>10} {'arxiv.Result':>14} {'PaperRecord':>13} {'shared records':>16}")
+    for page_size in args.page_sizes:
+        corpus = ArxivCorpus(page_size)
+        feed = corpus.feed("http://127.0.0.1", corpus.entries, 0, page_size)
+
+        # Before, every session held the arxiv.Result objects of its own search
+        results = bytes_per_session(lambda: session_state(fetch_results(feed)), args.sessions)
+        # Records built from separately fetched results, the worst case once the search cache has expired
+        own = bytes_per_session(
+            lambda: session_state([PaperRecord.from_result(r) for r in fetch_results(feed)]), args.sessions
+        )
+        # Records handed out by the shared search cache, sessions only hold references to them
+        cached = [PaperRecord.from_result(r) for r in fetch_results(feed)]
+        shared = bytes_per_session(lambda: session_state(cached), args.sessions)
+
+        print(f"{page_size:>10} {results:>14,.0f} {own:>13,.0f} {shared:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the pages import on a cold start, and the heavy dependencies they used to pull in eagerly
+MODULES = [
+    "categories",
+    "arxiv_service",
+    "utils",
+    "batch_summarizer",
+    "prefetch",
+    "gemini_client",
+    "paper_index",
+    "transformers",
+    "pymupdf4llm",
+    "google.genai",
+]
+
+# Runs app.py in streamlit's headless test harness and times its first full script run
+FIRST_RENDER = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=600)
+app.run()
+elapsed = time.perf_counter() - start
+assert not app.exception, app.exception
+print(elapsed)
+"""
+
+
+def run(code, mode):
+    env = dict(os.environ, PAPER_DISTILL_STARTUP=mode)
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return completed
+
+
+def import_seconds(module, mode):
+    # -X importtime reports the cumulative time of every import, the last line is the top level module
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=dict(os.environ, PAPER_DISTILL_STARTUP=mode),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return None
+    last = [line for line in completed.stderr.splitlines() if line.startswith("import time:")][-1]
+    return int(last.split("|")[1]) / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import times and time to first render")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["lazy", "warm"])
+    args = parser.parse_args()
+
+    print(f"{'module':>18} {'import s':>9}")
+    for module in MODULES:
+        seconds = [import_seconds(module, "lazy") for _ in range(args.repeats)]
+        if None in seconds:
+            print(f"{module:>18} {'failed':>9}")
+            continue
+        print(f"{module:>18} {statistics.median(seconds):>9.3f}")
+
+    print()
+    print(f"{'startup':>18} {'first render s':>15}")
+    for mode in args.modes:
+        try:
+            seconds = [float(run(FIRST_RENDER, mode).stdout.strip().splitlines()[-1]) for _ in range(args.repeats)]
+        except RuntimeError as e:
+            print(f"{mode:>18} failed: {e}")
+            continue
+        print(f"{mode:>18} {statistics.median(seconds):>15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Used when no abstracts file is given
+SAMPLE_ABSTRACTS = [
+    "We present a method for training sequence to sequence models that combines a denoising objective with "
+    "an autoregressive decoder. The input text is corrupted with an arbitrary noising function and the model "
+    "learns to reconstruct the original text. We evaluate a number of noising approaches and find the best "
+    "performance by randomly shuffling the order of sentences and using a novel in-filling scheme where spans "
+    "of text are replaced with a single mask token. The approach is particularly effective when fine tuned for "
+    "text generation and also works well for comprehension tasks, matching strong baselines on several benchmarks.",
+    "Long documents are difficult for attention based models because the cost of self attention grows "
+    "quadratically with sequence length. We study a family of sparse attention patterns that combine local "
+    "windows with a small number of global tokens, and show that they retain most of the quality of full "
+    "attention on question answering and summarization while reducing memory use by an order of magnitude. "
+    "We further analyse which layers benefit most from global attention and release our implementation.",
+    "We investigate the effect of model compression on the calibration of neural text classifiers. Pruning, "
+    "distillation and quantization all reduce inference cost, but their impact on the reliability of predicted "
+    "probabilities is poorly understood. Across six datasets we find that distillation preserves calibration "
+    "best, while aggressive pruning leads to systematic overconfidence that can be corrected with temperature scaling.",
+]
+
+
+def tokens(text):
+    return text.lower().split()
+
+
+def rouge_1(reference, candidate):
+    ref, cand = tokens(reference), tokens(candidate)
+    overlap = sum(min(ref.count(word), cand.count(word)) for word in set(cand))
+    if not ref or not cand or not overlap:
+        return 0.0
+    precision, recall = overlap / len(cand), overlap / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def rouge_l(reference, candidate):
+    ref, cand = tokens(reference), tokens(candidate)
+    if not ref or not cand:
+        return 0.0
+    # Longest common subsequence by dynamic programming over a single row
+    row = [0] * (len(cand) + 1)
+    for word in ref:
+        previous = 0
+        for j, other in enumerate(cand, start=1):
+            current = row[j]
+            row[j] = previous + 1 if word == other else max(row[j], row[j - 1])
+            previous = current
+    lcs = row[-1]
+    if not lcs:
+        return 0.0
+    precision, recall = lcs / len(cand), lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+
+def run_backend(backend, abstracts, repeats):
+    # Runs inside a fresh interpreter so the RSS figure belongs to this backend alone
+    os.environ["PAPER_DISTILL_SUMMARIZER_BACKEND"] = backend
+    sys.path.insert(0, ROOT)
+    start = time.perf_counter()
+    from utils import load_summarizer
+
+    summarizer = load_summarizer(backend)
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    outputs = []
+    for abstract in abstracts:
+        length = round(len(abstract.split()) * 0.4)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            summary = summarizer(abstract, max_length=length + 10, min_length=length - 10, do_sample=False)[0]["summary_text"]
+            latencies.append(time.perf_counter() - start)
+        outputs.append(summary)
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "p50_seconds": statistics.median(latencies),
+        "mean_seconds": statistics.mean(latencies),
+        # ru_maxrss is in kilobytes on linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "outputs": outputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare abstract summarizer inference backends")
+    parser.add_argument("--backends", nargs="+", default=["pytorch", "int8", "onnx"])
+    parser.add_argument("--abstracts", help="JSON file with a list of abstracts to summarize")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    abstracts = SAMPLE_ABSTRACTS
+    if args.abstracts:
+        with open(args.abstracts, encoding="utf-8") as f:
+            abstracts = json.load(f)
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, abstracts, args.repeats)))
+        return
+
+    results = []
+    for backend in args.backends:
+        command = [sys.executable, __file__, "--worker", backend, "--repeats", str(args.repeats)]
+        if args.abstracts:
+            command += ["--abstracts", args.abstracts]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{backend}: failed\n{completed.stderr.strip().splitlines()[-1]}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    # Drift is measured against the full precision pipeline when it was part of the run
+    reference = next((r for r in results if r["backend"] == "pytorch"), None)
+    print(f"{'backend':>8} {'load s':>8} {'p50 s':>8} {'mean s':>8} {'rss MB':>8} {'rouge1':>7} {'rougeL':>7}")
+    for result in results:
+        if reference is not None:
+            pairs = list(zip(reference["outputs"], result["outputs"]))
+            r1 = statistics.mean(rouge_1(ref, cand) for ref, cand in pairs)
+            rl = statistics.mean(rouge_l(ref, cand) for ref, cand in pairs)
+            drift = f"{r1:>7.3f} {rl:>7.3f}"
+        else:
+            drift = f"{'-':>7} {'-':>7}"
+        print(
+            f"{result['backend']:>8} {result['load_seconds']:>8.2f} {result['p50_seconds']:>8.3f} "
+            f"{result['mean_seconds']:>8.3f} {result['max_rss_mb']:>8.0f} {drift}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FEED_FIXTURE = os.path.join(FIXTURES, "arxiv_feed.xml")
+
+ATOM = "http://www.w3.org/2005/Atom"
+OPENSEARCH = "http://a9.com/-/spec/opensearch/1.1/"
+ARXIV = "http://arxiv.org/schemas/atom"
+ET.register_namespace("", ATOM)
+ET.register_namespace("opensearch", OPENSEARCH)
+ET.register_namespace("arxiv", ARXIV)
+
+# Same size as the all-MiniLM-L6-v2 vectors the app normally uses
+EMBEDDING_DIM = 384
+
+
+def _short_id(entry):
+    return entry.find(f"{{{ATOM}}}id").text.rsplit("/abs/", 1)[-1]
+
+
+def _words(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class ArxivCorpus:
+    # The recorded feed entries, cloned under new ids until there are `size` papers, each with a generated pdf
+
+    def __init__(self, size=12, page_counts=(4, 12, 24), feed_path=FEED_FIXTURE):
+        recorded = ET.parse(feed_path).getroot().findall(f"{{{ATOM}}}entry")
+        self.entries = []
+        self.page_counts = {}
+        for i in range(max(size, 1)):
+            entry = copy.deepcopy(recorded[i % len(recorded)])
+            if i >= len(recorded):
+                entry_id = f"2501.{i:05d}v1"
+                entry.find(f"{{{ATOM}}}id").text = f"http://arxiv.org/abs/{entry_id}"
+                title = entry.find(f"{{{ATOM}}}title")
+                title.text = f"{title.text} ({i})"
+            self.entries.append(entry)
+            self.page_counts[_short_id(entry)] = page_counts[i % len(page_counts)]
+        self.pdfs = {}
+        self.lock = threading.Lock()
+
+    def ids(self):
+        return [_short_id(entry) for entry in self.entries]
+
+    def select(self, id_list):
+        # Ids may be asked for with or without a version, like the real API
+        wanted = set(id_list)
+        return [
+            entry for entry in self.entries
+            if _short_id(entry) in wanted or _short_id(entry).rsplit("v", 1)[0] in wanted
+        ]
+
+    def feed(self, base_url, entries, start, max_results):
+        root = ET.Element(f"{{{ATOM}}}feed")
+        ET.SubElement(root, f"{{{ATOM}}}title").text = "ArXiv Query"
+        ET.SubElement(root, f"{{{ATOM}}}id").text = f"{base_url}/api/query"
+        ET.SubElement(root, f"{{{ATOM}}}updated").text = "2025-03-10T00:00:00-04:00"
+        page = entries[start:start + max_results]
+        ET.SubElement(root, f"{{{OPENSEARCH}}}totalResults").text = str(len(entries))
+        ET.SubElement(root, f"{{{OPENSEARCH}}}startIndex").text = str(start)
+        ET.SubElement(root, f"{{{OPENSEARCH}}}itemsPerPage").text = str(len(page))
+        for entry in page:
+            entry = copy.deepcopy(entry)
+            # Pdf links point back at this server
+            for link in entry.findall(f"{{{ATOM}}}link"):
+                if link.get("title") == "pdf":
+                    link.set("href", f"{base_url}/pdf/{_short_id(entry)}")
+            root.append(entry)
+        return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+    def pdf(self, entry_id):
+        with self.lock:
+            if entry_id not in self.pdfs:
+                entry = self.select([entry_id])
+                if not entry:
+                    return None
+                self.pdfs[entry_id] = _build_pdf(entry[0], self.page_counts[_short_id(entry[0])])
+            return self.pdfs[entry_id]
+
+
+def _build_pdf(entry, pages):
+    # A deterministic paper with a title, numbered section headings and body text built from its abstract
+    import pymupdf
+
+    title = " ".join(entry.find(f"{{{ATOM}}}title").text.split())
+    abstract = " ".join(entry.find(f"{{{ATOM}}}summary").text.split())
+    sentences = re.split(r"(?<=\.) ", abstract)
+    doc = pymupdf.open()
+    for number in range(pages):
+        page = doc.new_page()
+        y = 72
+        if number == 0:
+            page.insert_textbox(pymupdf.Rect(72, y, 540, y + 60), title, fontsize=18, fontname="hebo")
+            y += 70
+        for section in range(2):
+            heading = f"{number * 2 + section + 1} Section {number * 2 + section + 1}"
+            page.insert_textbox(pymupdf.Rect(72, y, 540, y + 24), heading, fontsize=14, fontname="hebo")
+            y += 30
+            # Rotate the sentences so paragraphs differ from each other
+            shift = (number * 2 + section) % len(sentences)
+            body = " ".join(sentences[shift:] + sentences[:shift])
+            page.insert_textbox(pymupdf.Rect(72, y, 540, y + 300), body, fontsize=10, fontname="helv")
+            y += 310
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def parse_request(self):
+        # Every request is logged as (method, path) so tests can count what reached the server
+        if not super().parse_request():
+            return False
+        self.server.requests.append((self.command, urlparse(self.path).path))
+        return True
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ArxivHandler(_StubHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        corpus = self.server.corpus
+        if url.path == "/api/query":
+            params = {key: values[0] for key, values in parse_qs(url.query).items()}
+            id_list = [i for i in params.get("id_list", "").split(",") if i]
+            # Every query matches the whole corpus, only paging and id lookups change the feed
+            entries = corpus.select(id_list) if id_list else corpus.entries
+            start = int(params.get("start", 0))
+            max_results = int(params.get("max_results", 10))
+            time.sleep(self.server.latency)
+            body = corpus.feed(self.server.base_url, entries, start, max_results)
+            self._send(200, body, "application/atom+xml")
+        elif url.path.startswith("/pdf/"):
+            self._pdf(url.path[len("/pdf/"):], head=False)
+        else:
+            self._send(404, b"not found", "text/plain")
+
+    def do_HEAD(self):
+        self._pdf(urlparse(self.path).path[len("/pdf/"):], head=True)
+
+    def _pdf(self, entry_id, head):
+        # Pdfs support conditional requests and byte ranges, and with drop_after set the first
+        # full download of each pdf is cut off after that many bytes, like a dropped connection
+        data = self.server.corpus.pdf(entry_id)
+        if data is None:
+            self._send(404, b"not found", "text/plain")
+            return
+        etag = '"' + hashlib.sha256(data).hexdigest()[:16] + '"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        status, start = 200, 0
+        match = re.match(r"bytes=(\d+)-$", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            status, start = 206, int(match.group(1))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+        body = data[start:]
+
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 10 Mar 2025 00:00:00 GMT")
+        self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.end_headers()
+        if head:
+            return
+        with self.server.drop_lock:
+            drop = self.server.drop_after is not None and status == 200 and entry_id not in self.server.dropped
+            self.server.dropped.add(entry_id)
+        if drop:
+            self.wfile.write(body[:self.server.drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _request_text(request):
+    parts = []
+    for content in request.get("contents", []):
+        parts.extend(part.get("text", "") for part in content.get("parts", []))
+    instruction = request.get("systemInstruction") or request.get("system_instruction") or {}
+    parts.extend(part.get("text", "") for part in instruction.get("parts", []))
+    return " ".join(parts)
+
+
+def _embedding(text):
+    # Hashed bag of words, similar texts get similar vectors without a model
+    vector = [0.0] * EMBEDDING_DIM
+    for word in _words(text):
+        bucket = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+        vector[bucket % EMBEDDING_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _GenaiHandler(_StubHandler):
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        request = self._read_json()
+        if url.path == "/embed":
+            self._send_json({"embeddings": [_embedding(text) for text in request.get("texts", [])]})
+        elif url.path.endswith("/cachedContents") and self.server.fail_contexts:
+            error = {"code": 400, "message": "context caching unavailable", "status": "INVALID_ARGUMENT"}
+            self._send_json({"error": error}, 400)
+        elif url.path.endswith("/cachedContents"):
+            tokens = _estimate_tokens(_request_text(request))
+            time.sleep(self.server.first_token)
+            self._send_json({
+                "name": f"cachedContents/bench{next(self.server.contexts)}",
+                "model": request.get("model", ""),
+                "expireTime": "2099-01-01T00:00:00Z",
+                "usageMetadata": {"totalTokenCount": tokens},
+            })
+        elif url.path.endswith(":countTokens"):
+            self._send_json({"totalTokens": _estimate_tokens(_request_text(request))})
+        elif url.path.endswith(":generateContent"):
+            chunks = self.server.response_chunks
+            time.sleep(self.server.first_token + self.server.chunk_delay * (len(chunks) - 1))
+            self._send_json(self._response(request, "".join(chunks)))
+        elif url.path.endswith(":streamGenerateContent"):
+            self._stream(request)
+        else:
+            self._send_json({"error": {"code": 404, "message": "not found"}}, 404)
+
+    def do_DELETE(self):
+        self._send_json({})
+
+    def _response(self, request, text):
+        prompt_tokens = _estimate_tokens(_request_text(request))
+        output_tokens = _estimate_tokens(text)
+        return {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens,
+            },
+            "modelVersion": self.server.model,
+        }
+
+    def _stream(self, request):
+        # Server-sent events, one JSON response per chunk, with the first one after the first token latency
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        time.sleep(self.server.first_token)
+        for i, chunk in enumerate(self.server.response_chunks):
+            if i:
+                time.sleep(self.server.chunk_delay)
+            self.wfile.write(f"data: {json.dumps(self._response(request, chunk))}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+
+
+# Text every fake response is built from, split into streamed chunks
+RESPONSE_TEXT = (
+    "The paper proposes a method and evaluates it on standard benchmarks. "
+    "Its main contribution is a simpler training objective that scales to longer inputs. "
+    "Results improve on strong baselines while using less compute.\n\n"
+    "The authors also analyse where the method fails and which design choices matter most. "
+    "Ablations show that each component contributes to the final result.\n\n"
+    "Related questions: How does it compare on longer documents? What does training cost? "
+    "Which parts transfer to other tasks?"
+)
+
+
+def _split_chunks(text, count):
+    words = text.split(" ")
+    size = math.ceil(len(words) / count)
+    return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+
+def count_requests(server, method, path_suffix=""):
+    return sum(1 for logged_method, path in server.requests if logged_method == method and path.endswith(path_suffix))
+
+
+def _serve(handler, **state):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.requests = []
+    for name, value in state.items():
+        setattr(server, name, value)
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server
+
+
+def start_arxiv_stub(corpus, latency=0.0, drop_after=None):
+    # Serves the corpus as an Atom feed at /api/query and its pdfs at /pdf/<id>
+    return _serve(
+        _ArxivHandler, corpus=corpus, latency=latency, drop_after=drop_after, dropped=set(), drop_lock=threading.Lock()
+    )
+
+
+def start_genai_stub(first_token=0.3, chunk_delay=0.05, chunks=8, model="gemini-2.0-flash-001"):
+    # Answers generateContent, streamGenerateContent, countTokens and cachedContents like the Gemini API,
+    # plus an /embed endpoint for the paper index, after the configured latencies. Setting fail_contexts on
+    # the returned server makes registering a cached context fail
+    return _serve(
+        _GenaiHandler,
+        first_token=first_token,
+        chunk_delay=chunk_delay,
+        response_chunks=_split_chunks(RESPONSE_TEXT, chunks),
+        model=model,
+        contexts=itertools.count(1),
+        fail_contexts=False,
+    )
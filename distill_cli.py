@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import pdf_convert
+from arxiv_service import get_arxiv_service
+from batch_summarizer import summarize_abstracts
+from categories import categories_dict
+from gemini_client import generate_paper_summary, get_genai_client
+from local_summary import summarize_paper_locally
+from paper_cache import get_markdown, get_pdf_path, paper_key
+
+COMPLEXITIES = ["High School", "Undergraduate", "Graduate", "PhD"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Distill arXiv papers headlessly: download, convert, summarize the abstract and the paper, write JSONL"
+    )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--ids", nargs="+", help="arXiv ids, with or without a version")
+    source.add_argument("--ids-file", help="File with one arXiv id per line")
+    source.add_argument("--query", help="Search query, like the search page")
+    parser.add_argument("--categories", nargs="*", default=[], help="Category codes to restrict --query to, e.g. cs.CL")
+    parser.add_argument("--max-results", type=int, default=10, help="Number of --query results to distill")
+    parser.add_argument("--output", required=True, help="JSONL file, papers already in it are skipped")
+
+    parser.add_argument("--abstract-length", type=int, default=50, help="Abstract summary length in percent")
+    parser.add_argument("--paragraphs", type=int, default=3, help="Paper summary length in paragraphs")
+    parser.add_argument("--complexity", choices=COMPLEXITIES, default="Graduate")
+    parser.add_argument("--engine", choices=["gemini", "local"], default="gemini", help="Paper summary engine")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_AI_STUDIO_API_KEY"), help="Gemini API key")
+
+    # Each stage has its own bound
+    parser.add_argument("--download-threads", type=int, default=4, help="Parallel pdf downloads")
+    parser.add_argument("--convert-jobs", type=int, default=2, help="Papers converted at once")
+    parser.add_argument("--convert-processes", type=int, default=pdf_convert.CONVERT_WORKERS,
+                        help="Processes the page-sharded conversion uses")
+    parser.add_argument("--summary-threads", type=int, default=4, help="Parallel Gemini paper summaries")
+    args = parser.parse_args(argv)
+
+    if args.engine == "gemini" and not args.api_key:
+        parser.error("--engine gemini needs --api-key or GOOGLE_AI_STUDIO_API_KEY")
+    return args
+
+
+def load_done(path):
+    # Papers written by an earlier run, a run that was interrupted picks up where it stopped
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+def resolve_papers(args):
+    service = get_arxiv_service()
+    if args.query is not None:
+        return service.search(args.query, args.categories, args.max_results)
+    ids = args.ids
+    if args.ids_file:
+        with open(args.ids_file, encoding="utf-8") as f:
+            ids = [line.strip() for line in f if line.strip()]
+    return service.get_papers(ids)
+
+
+def paper_record(paper):
+    return {
+        "id": paper_key(paper),
+        "title": paper.title,
+        "authors": list(paper.authors),
+        "published": paper.published,
+        "categories": [categories_dict.get(cat, cat) for cat in paper.categories],
+        "pdf_url": paper.pdf_url,
+    }
+
+
+def run(args):
+    done = load_done(args.output)
+    papers = [paper for paper in resolve_papers(args) if paper_key(paper) not in done]
+    print(f"{len(done)} already distilled, {len(papers)} to go", file=sys.stderr)
+    if not papers:
+        return 0
+
+    client = get_genai_client(args.api_key) if args.engine == "gemini" else None
+
+    def summarize_paper(paper):
+        markdown = get_markdown(paper)
+        if args.engine == "gemini":
+            return generate_paper_summary(client, paper_key(paper), markdown, args.paragraphs, args.complexity)
+        return summarize_paper_locally(paper_key(paper), markdown, args.paragraphs)
+
+    paper_summaries = {}
+    errors = {}
+    written = set()
+
+    def write_ready(abstract_summaries):
+        # Papers are appended as soon as everything for them is ready, so an interrupted run loses little.
+        # Failed papers are written too but not counted as done, so the next run retries them
+        with open(args.output, "a", encoding="utf-8") as f:
+            for i, paper in enumerate(papers):
+                if i in written or (i not in errors and (i not in paper_summaries or abstract_summaries is None)):
+                    continue
+                record = paper_record(paper)
+                if i in errors:
+                    record["error"] = errors[i]
+                else:
+                    record.update(
+                        abstract_summary=abstract_summaries[i],
+                        paper_summary=paper_summaries[i],
+                        engine=args.engine,
+                        paragraphs=args.paragraphs,
+                        complexity=args.complexity if args.engine == "gemini" else None,
+                        abstract_length=args.abstract_length,
+                    )
+                f.write(json.dumps(record) + "\n")
+                written.add(i)
+
+    with ThreadPoolExecutor(1, thread_name_prefix="abstracts") as abstract_pool, \
+            ThreadPoolExecutor(args.download_threads, thread_name_prefix="download") as download_pool, \
+            ThreadPoolExecutor(args.convert_jobs, thread_name_prefix="convert") as convert_pool, \
+            ThreadPoolExecutor(args.summary_threads, thread_name_prefix="summary") as summary_pool:
+        # Every abstract goes to the model in one batched call while the pdfs download
+        stages = {
+            abstract_pool.submit(summarize_abstracts, [paper.summary for paper in papers], args.abstract_length):
+                ("abstracts", None)
+        }
+        abstract_summaries = None
+
+        # Each paper moves download -> convert -> summary, with its next stage submitted as soon as one finishes
+        for i, paper in enumerate(papers):
+            stages[download_pool.submit(get_pdf_path, paper)] = ("download", i)
+
+        while stages:
+            finished, _ = wait(stages, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, i = stages.pop(future)
+                error = future.exception()
+                if name == "abstracts":
+                    if error is not None:
+                        errors.update({j: f"abstract summary: {error}" for j in range(len(papers))})
+                    else:
+                        abstract_summaries = future.result()
+                elif error is not None:
+                    errors[i] = f"{name}: {error}"
+                elif name == "download":
+                    stages[convert_pool.submit(get_markdown, papers[i], args.convert_processes)] = ("convert", i)
+                elif name == "convert":
+                    stages[summary_pool.submit(summarize_paper, papers[i])] = ("summary", i)
+                else:
+                    paper_summaries[i] = future.result()
+            write_ready(abstract_summaries)
+
+    print(f"{len(papers) - len(errors)} distilled, {len(errors)} failed", file=sys.stderr)
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    sys.exit(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
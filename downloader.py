@@ -0,0 +1,211 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Most downloads running at once across the whole process, arXiv asks clients not to hammer it
+DOWNLOAD_CONCURRENCY = int(os.environ.get("PAPER_DISTILL_DOWNLOAD_CONCURRENCY", 4))
+# Total download bandwidth shared by every download, 0 leaves it unlimited
+DOWNLOAD_BYTES_PER_SECOND = int(os.environ.get("PAPER_DISTILL_DOWNLOAD_BYTES_PER_SECOND", 0))
+# Attempts at a download whose connection drops partway, each one resumes where the last stopped
+DOWNLOAD_ATTEMPTS = 4
+CHUNK_SIZE = 64 * 1024
+# Seconds to connect and between received bytes
+TIMEOUT = (10, 60)
+USER_AGENT = "paper-distill"
+
+META_SUFFIX = ".meta.json"
+PART_SUFFIX = ".part"
+
+
+class DownloadError(Exception):
+    pass
+
+
+class TokenBucket:
+    # Shares a byte rate between threads, each chunk waits until enough tokens have accumulated
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, CHUNK_SIZE)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going negative reserves the tokens, later callers wait behind this one
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+def _read_meta(path):
+    try:
+        with open(path + META_SUFFIX, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_meta(path, meta):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path + META_SUFFIX)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _validators(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+class Downloader:
+    # Keep-alive connection pool shared by every download, with retries, resume and global limits
+
+    def __init__(self, concurrency=DOWNLOAD_CONCURRENCY, bytes_per_second=DOWNLOAD_BYTES_PER_SECOND):
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        # Retries cover refused connections and overloaded responses, dropped transfers are resumed below
+        retry = Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET", "HEAD"],
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.bandwidth = TokenBucket(bytes_per_second)
+
+    def download(self, url, path, revalidate=False):
+        # Download url to path, streaming into path.part and renaming it once complete. Validators are kept in
+        # path.meta.json. An existing file is only requested again with revalidate, as a conditional request.
+        # Returns {"changed", "bytes", "resumed", "requests"}, where resumed counts the bytes a partial file
+        # from an earlier call already had
+        if os.path.exists(path) and not revalidate:
+            return {"changed": False, "bytes": 0, "resumed": 0, "requests": 0}
+
+        with self.slots:
+            if os.path.exists(path):
+                if self._not_modified(url, path):
+                    return {"changed": False, "bytes": 0, "resumed": 0, "requests": 1}
+            return self._fetch(url, path)
+
+    def _not_modified(self, url, path):
+        meta = _read_meta(path)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        if not headers:
+            return False
+        response = self.session.head(url, headers=headers, timeout=TIMEOUT, allow_redirects=True)
+        if response.status_code == 304:
+            _write_meta(path, {**meta, "checked": time.time()})
+            return True
+        return False
+
+    def _fetch(self, url, path):
+        part_path = path + PART_SUFFIX
+        # Left behind by an earlier download that was cut short
+        resumed = self._resume_offset(part_path)
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                done, offset = self._attempt(url, part_path)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == DOWNLOAD_ATTEMPTS - 1:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            # The server sends the whole file again if it changed since the part file was written
+            resumed = min(resumed, offset)
+            if done:
+                meta = _read_meta(part_path)
+                os.replace(part_path, path)
+                size = os.path.getsize(path)
+                _write_meta(path, {**meta, "url": url, "size": size, "checked": time.time()})
+                os.remove(part_path + META_SUFFIX)
+                return {"changed": True, "bytes": size - resumed, "resumed": resumed, "requests": attempt + 1}
+        raise DownloadError(f"Download of {url} kept stopping short")
+
+    @staticmethod
+    def _resume_offset(part_path):
+        # A part file can only be resumed if the server can tell us whether the file changed since
+        if not os.path.exists(part_path):
+            return 0
+        meta = _read_meta(part_path)
+        return os.path.getsize(part_path) if meta.get("etag") or meta.get("last_modified") else 0
+
+    def _attempt(self, url, part_path):
+        # One request, resuming part_path when it has content and the server still has the same file.
+        # Returns whether the file is complete and the offset the response continued from
+        offset = self._resume_offset(part_path)
+        headers = {}
+        if offset:
+            meta = _read_meta(part_path)
+            headers["Range"] = f"bytes={offset}-"
+            # The server answers with the whole file instead of the range if it has changed since
+            headers["If-Range"] = meta.get("etag") or meta["last_modified"]
+
+        with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 416:
+                # Nothing left after offset, the part file is already complete
+                return True, offset
+            response.raise_for_status()
+            if response.status_code != 206:
+                offset = 0
+            total = self._total_size(response, offset)
+            if offset == 0:
+                _write_meta(part_path, _validators(response))
+
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    self.bandwidth.consume(len(chunk))
+                    f.write(chunk)
+        return total is None or os.path.getsize(part_path) >= total, offset
+
+    @staticmethod
+    def _total_size(response, offset):
+        content_range = response.headers.get("Content-Range")
+        if content_range and "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1])
+        length = response.headers.get("Content-Length")
+        # Compressed responses report the compressed length, which can't be compared to the bytes written
+        if length is not None and not response.headers.get("Content-Encoding"):
+            return offset + int(length)
+        return None
+
+
+def last_checked(path):
+    # When path was last downloaded or confirmed unchanged, 0 if that isn't known
+    return _read_meta(path).get("checked", 0)
+
+
+# One downloader per process so every session's downloads share its connections and limits
+@st.cache_resource
+def get_downloader():
+    return Downloader()
@@ -0,0 +1,170 @@
+import os
+import threading
+import time
+
+import streamlit as st
+
+from metrics import stage
+from result_cache import get_result_cache, make_key, template_hash
+from token_budget import fit_gemini_input
+
+# Pinned model version, provider side context caching only works with a fixed version
+GEMINI_MODEL = "gemini-2.0-flash-001"
+# Send requests to another endpoint instead of Google's, e.g. a local fake for offline tests
+GEMINI_BASE_URL = os.environ.get("PAPER_DISTILL_GEMINI_BASE_URL")
+# How long a registered paper context lives on the provider if its sessions never move on
+CONTEXT_TTL_SECONDS = 900
+# A context this close to expiring is registered again rather than used for another request
+CONTEXT_RENEW_SECONDS = 30
+# Papers shorter than the provider's minimum for a cached context are sent inline instead,
+# tokens never outnumber characters so this skips contexts that are certainly too small
+MIN_CONTEXT_CHARS = 4096
+
+# Prompt template for paper summaries, its hash is part of the result cache key
+SUMMARY_INSTRUCTION = "Condense this academic paper into a summary with a length of {length} paragraphs. Write it using vocabulary terms and explanations appropriate for a {complexity} student, but still keep it informative and professional. Do not add any formatting or introduction, simply return the requested number of paragraphs of summarized content."
+CONTEXT_INSTRUCTION = "You are given an academic paper converted to markdown. Follow the instructions in the request about this paper."
+QUESTION_INSTRUCTION = "You are extremely knowledgeable about the paper in question, its title, abstract and the excerpts most relevant to the question are provided. Answer the question based on what you know about the paper, politley decline any request not related to the paper. At the end of your response suggest 3 related questions to be asked."
+QUESTION_CONTEXT = "Title: {title}\n\nAbstract: {abstract}\n\nRelevant excerpts from the paper:\n\n{excerpts}"
+
+# Provider side contexts by paper, one per paper shared by every session and job working on it
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+# One client per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def get_genai_client(api_key):
+    # google.genai is slow to import, it is only loaded once the client is needed
+    from google import genai
+    from google.genai import types
+
+    http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def _paper_context(paper_id):
+    # Must be called with _contexts_lock held
+    context = _contexts.get(paper_id)
+    if context is None:
+        context = {"name": None, "expires": 0, "sessions": 0, "lock": threading.Lock()}
+        _contexts[paper_id] = context
+    return context
+
+
+def _delete_context(client, name):
+    try:
+        client.caches.delete(name=name)
+    except Exception:
+        # The context expires on its own through its TTL anyway
+        pass
+
+
+def get_paper_context(client, paper_id, paper_text):
+    # Register the paper once with the provider and return its handle, later requests refer to it
+    # instead of sending the whole paper again. Returns None when the paper should be sent inline
+    with _contexts_lock:
+        # Forget contexts that expired with no session holding them, e.g. ones whose sessions were closed
+        now = time.time()
+        expired = [
+            key for key, context in _contexts.items() if not context["sessions"] and 0 < context["expires"] <= now
+        ]
+        for key in expired:
+            del _contexts[key]
+        context = _paper_context(paper_id)
+
+    # Requests for the same paper wait for the first one to register it rather than registering it twice
+    with context["lock"]:
+        if context["expires"] > time.time() + CONTEXT_RENEW_SECONDS:
+            return context["name"]
+        if context["name"] is not None:
+            _delete_context(client, context["name"])
+
+        from google.genai import types
+
+        text = paper_text()
+        name = None
+        if len(text) >= MIN_CONTEXT_CHARS:
+            try:
+                with stage("remote_context", bytes=len(text)):
+                    cache = client.caches.create(
+                        model=GEMINI_MODEL,
+                        config=types.CreateCachedContentConfig(
+                            system_instruction=CONTEXT_INSTRUCTION,
+                            contents=[text],
+                            ttl=f"{CONTEXT_TTL_SECONDS}s",
+                        ),
+                    )
+                name = cache.name
+            except Exception:
+                # Too short for the provider's minimum or caching unavailable, fall back to sending the paper inline
+                name = None
+        context["name"] = name
+        context["expires"] = time.time() + CONTEXT_TTL_SECONDS
+        return name
+
+
+def hold_paper_context(client, session_state, paper_id):
+    # The session has paper_id open, its context is kept until the last session holding it moves on.
+    # Opening another paper releases the one the session held before
+    if session_state.get("paper_context") == paper_id:
+        return
+    release_paper_context(client, session_state)
+    with _contexts_lock:
+        _paper_context(paper_id)["sessions"] += 1
+    session_state["paper_context"] = paper_id
+
+
+def release_paper_context(client, session_state):
+    # The session moved on from its paper, the context is deleted from the provider if no other session has it open
+    paper_id = session_state.get("paper_context")
+    session_state["paper_context"] = None
+    if paper_id is None:
+        return
+    with _contexts_lock:
+        context = _contexts.get(paper_id)
+        if context is None:
+            return
+        context["sessions"] -= 1
+        if context["sessions"] > 0:
+            return
+        del _contexts[paper_id]
+    # A job still registering it leaves a context that only its TTL releases
+    if context["name"] is not None:
+        _delete_context(client, context["name"])
+
+
+def paper_summary_cache_key(paper_id, length, complexity):
+    return make_key(
+        "paper_summary",
+        paper=paper_id,
+        model=GEMINI_MODEL,
+        template=template_hash(SUMMARY_INSTRUCTION),
+        length=length,
+        complexity=complexity,
+    )
+
+
+def generate_paper_summary(client, paper_id, markdown, length, complexity):
+    # Non-streaming paper summary for headless use, shares its cache entries with the details page
+    from google.genai import types
+
+    cache = get_result_cache()
+    cache_key = paper_summary_cache_key(paper_id, length, complexity)
+    summary = cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    text = fit_gemini_input(client, GEMINI_MODEL, markdown)
+    with stage("remote_llm", kind="paper_summary") as event:
+        response = client.models.generate_content(
+            model=GEMINI_MODEL,
+            config=types.GenerateContentConfig(
+                system_instruction=SUMMARY_INSTRUCTION.format(length=length, complexity=complexity)),
+            contents=[text]
+        )
+        if response.usage_metadata is not None:
+            event["tokens"] = response.usage_metadata.total_token_count
+    summary = response.text
+    if summary:
+        cache.put(cache_key, summary)
+    return summary
@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import streamlit as st
+
+from gemini_client import (
+    GEMINI_MODEL,
+    QUESTION_CONTEXT,
+    QUESTION_INSTRUCTION,
+    SUMMARY_INSTRUCTION,
+    get_paper_context,
+    paper_summary_cache_key,
+)
+from local_summary import local_summary_cache_key, summarize_paper_locally
+from metrics import record, stage
+from paper_cache import get_markdown, paper_key
+from paper_index import TOP_K, top_chunks
+from result_cache import get_result_cache, make_key, normalize_question, template_hash
+from token_budget import fit_gemini_input
+
+# Worker threads running summary and question jobs for every session
+JOB_WORKERS = int(os.environ.get("PAPER_DISTILL_JOB_WORKERS", 8))
+# Most requests to the Gemini API at once across the whole process, jobs over it wait for a free slot
+API_CONCURRENCY = int(os.environ.get("PAPER_DISTILL_API_CONCURRENCY", 4))
+# Finished jobs are kept this long, so a session that reruns or comes back late still finds its result
+JOB_RETENTION_SECONDS = 600
+# How often a page waiting on a job checks on it
+JOB_POLL_SECONDS = 1
+
+QUEUED = "queued"
+PREPARING = "preparing"
+WAITING = "waiting"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class Job:
+    # One summary or answer being generated, its text grows as the response streams in
+
+    def __init__(self, key, kind):
+        self.key = key
+        self.kind = kind
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.finished = None
+        self._parts = []
+        self._lock = threading.Lock()
+
+    @property
+    def text(self):
+        with self._lock:
+            return "".join(self._parts)
+
+    @property
+    def done(self):
+        return self.status in (DONE, FAILED)
+
+    def append(self, text):
+        with self._lock:
+            self._parts.append(text)
+
+    def set_status(self, status):
+        self.status = status
+
+
+class JobQueue:
+    # Runs long summaries and answers off the script thread, shared by every session so
+    # identical requests in flight are only generated once
+
+    def __init__(self, workers=JOB_WORKERS, api_concurrency=API_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jobs")
+        self.api_slots = threading.BoundedSemaphore(api_concurrency)
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def _prune(self):
+        now = time.time()
+        for key in [key for key, job in self.jobs.items() if job.done and job.finished + JOB_RETENTION_SECONDS < now]:
+            del self.jobs[key]
+
+    def submit(self, key, kind, fn):
+        # fn(job) does the work and returns the result, a job with the same key that is queued,
+        # running or recently finished is returned instead of starting another. Failed jobs are retried
+        with self.lock:
+            self._prune()
+            job = self.jobs.get(key)
+            if job is not None and job.status != FAILED:
+                return job
+            job = Job(key, kind)
+            self.jobs[key] = job
+        self.executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, key):
+        with self.lock:
+            return self.jobs.get(key)
+
+    def _run(self, job, fn):
+        with stage("job", kind=job.kind) as event:
+            # finished is set before the status, a done job is pruned by its finish time
+            try:
+                job.result = fn(job)
+                job.finished = time.time()
+                job.set_status(DONE)
+            except Exception as e:
+                event["error"] = type(e).__name__
+                job.error = str(e) or type(e).__name__
+                job.finished = time.time()
+                job.set_status(FAILED)
+
+    @contextmanager
+    def api_slot(self, job):
+        # Hold one of the process-wide API slots for the duration of a request
+        job.set_status(WAITING)
+        start = time.perf_counter()
+        with self.api_slots:
+            record({"stage": "api_wait", "kind": job.kind, "seconds": time.perf_counter() - start})
+            job.set_status(RUNNING)
+            yield
+
+
+# One queue per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+
+def _stream_into(job, response_stream):
+    # Append the response to the job as it arrives, partial text stays on the job if the stream fails
+    with stage("remote_llm", kind=job.kind) as event:
+        start = time.perf_counter()
+        received = 0
+        for chunk in response_stream:
+            # The last chunk carries the token usage for the whole request
+            if chunk.usage_metadata is not None and chunk.usage_metadata.total_token_count:
+                event["tokens"] = chunk.usage_metadata.total_token_count
+            if chunk.text:
+                if not received:
+                    event["first_token_seconds"] = time.perf_counter() - start
+                received += len(chunk.text)
+                job.append(chunk.text)
+        event["bytes"] = received
+    return job.text
+
+
+def _paper_summary(job, client, paper, length, complexity):
+    from google.genai import types
+
+    cache = get_result_cache()
+    # Another job may have finished this summary since the page checked
+    summary = cache.get(job.key)
+    if summary is not None:
+        return summary
+
+    job.set_status(PREPARING)
+    # Trim oversize papers to the model's input window before sending them
+    text = fit_gemini_input(client, GEMINI_MODEL, get_markdown(paper))
+    sys_instruct = SUMMARY_INSTRUCTION.format(length=length, complexity=complexity)
+
+    with get_job_queue().api_slot(job):
+        # Register the paper with the provider once, later summaries of it refer to it by handle
+        context_name = get_paper_context(client, paper_key(paper), lambda: text)
+        if context_name is not None:
+            # A cached context can't be combined with a system instruction, so the instructions go in the request
+            response_stream = client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                config=types.GenerateContentConfig(cached_content=context_name),
+                contents=[sys_instruct]
+            )
+        else:
+            response_stream = client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                config=types.GenerateContentConfig(system_instruction=sys_instruct),
+                contents=[text]
+            )
+        summary = _stream_into(job, response_stream)
+    # Only complete summaries are cached
+    if summary:
+        cache.put(job.key, summary)
+    return summary
+
+
+def submit_paper_summary(client, paper, length, complexity):
+    key = paper_summary_cache_key(paper_key(paper), length, complexity)
+    return get_job_queue().submit(
+        key, "paper_summary", lambda job: _paper_summary(job, client, paper, length, complexity)
+    )
+
+
+def submit_local_summary(paper, paragraphs):
+    def run(job):
+        job.set_status(PREPARING)
+        markdown = get_markdown(paper)
+        job.set_status(RUNNING)
+        return summarize_paper_locally(paper_key(paper), markdown, paragraphs)
+
+    key = local_summary_cache_key(paper_key(paper), paragraphs)
+    return get_job_queue().submit(key, "local_paper_summary", run)
+
+
+def answer_cache_key(paper_id, question):
+    return make_key(
+        "answer",
+        paper=paper_id,
+        model=GEMINI_MODEL,
+        template=template_hash(QUESTION_INSTRUCTION + QUESTION_CONTEXT),
+        top_k=TOP_K,
+        question=normalize_question(question),
+    )
+
+
+def _answer(job, client, paper, question):
+    from google.genai import types
+
+    cache = get_result_cache()
+    answer = cache.get(job.key)
+    if answer is not None:
+        return answer
+
+    job.set_status(PREPARING)
+    # Only send the sections of the paper most relevant to the question, found through
+    # the paper's embedding index, instead of the whole paper on every question
+    excerpts = "\n\n---\n\n".join(top_chunks(paper, get_markdown(paper), question))
+    context = QUESTION_CONTEXT.format(title=paper.title, abstract=paper.summary, excerpts=excerpts)
+
+    with get_job_queue().api_slot(job):
+        response_stream = client.models.generate_content_stream(
+            model=GEMINI_MODEL,
+            config=types.GenerateContentConfig(system_instruction=QUESTION_INSTRUCTION),
+            contents=[context, question]
+        )
+        answer = _stream_into(job, response_stream)
+    if answer:
+        cache.put(job.key, answer)
+    return answer
+
+
+def submit_question(client, paper, question):
+    key = answer_cache_key(paper_key(paper), question)
+    return get_job_queue().submit(key, "answer", lambda job: _answer(job, client, paper, question))
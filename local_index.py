@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+
+import streamlit as st
+
+from categories import categories_dict
+from metrics import stage
+from paper_record import PaperRecord
+
+# Full-text index of every paper this deployment has converted, searched without going to arXiv
+LOCAL_INDEX_PATH = os.environ.get(
+    "PAPER_DISTILL_LOCAL_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".local_index.sqlite"),
+)
+# BM25 weight of each indexed column, a match in the title counts for more than one deep in the paper
+COLUMN_WEIGHTS = {"title": 10.0, "abstract": 4.0, "categories": 2.0, "body": 1.0}
+# Most local hits shown above the arXiv results
+MAX_LOCAL_RESULTS = 10
+
+WORD = re.compile(r"\w+")
+
+
+def build_match(query, categories):
+    # Turn a free text query into an FTS5 expression, every word has to appear somewhere in the paper.
+    # Words are quoted so FTS5 syntax typed by users (AND, NEAR, column:, *) is searched for literally
+    terms = [f'"{word}"' for word in WORD.findall(query or "") if word not in {"AND", "OR", "ANDNOT"}]
+    if categories:
+        codes = " OR ".join(f'"{cat}"' for cat in categories)
+        terms.append(f"categories : ({codes})")
+    return " AND ".join(terms)
+
+
+class LocalIndex:
+    # BM25 ranked inverted index on disk (SQLite FTS5), one row per paper, updated as papers are converted
+
+    def __init__(self, path=LOCAL_INDEX_PATH):
+        self.path = path
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS papers ("
+                "id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, entry_id TEXT NOT NULL, "
+                "meta TEXT NOT NULL, indexed REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS paper_text USING fts5("
+                "title, abstract, categories, body, tokenize='unicode61 remove_diacritics 2')"
+            )
+
+    def _connect(self):
+        # A connection per call keeps the index usable from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, key, paper, markdown):
+        # The paper's record is stored with it, so local hits are listed without asking arXiv.
+        # Re-adding a paper replaces its row, so a re-converted paper is never indexed twice
+        if not isinstance(paper, PaperRecord):
+            paper = PaperRecord.from_result(paper)
+        categories = " ".join(list(paper.categories) + [categories_dict.get(cat, "") for cat in paper.categories])
+        with self._connect() as db:
+            row = db.execute("SELECT id FROM papers WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("DELETE FROM paper_text WHERE rowid = ?", row)
+                db.execute("DELETE FROM papers WHERE id = ?", row)
+            rowid = db.execute(
+                "INSERT INTO papers (key, entry_id, meta, indexed) VALUES (?, ?, ?, ?)",
+                (key, paper.entry_id, json.dumps(paper.to_dict()), time.time()),
+            ).lastrowid
+            db.execute(
+                "INSERT INTO paper_text (rowid, title, abstract, categories, body) VALUES (?, ?, ?, ?, ?)",
+                (rowid, paper.title, paper.summary, categories, markdown),
+            )
+
+    def remove(self, key):
+        with self._connect() as db:
+            row = db.execute("SELECT id FROM papers WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("DELETE FROM paper_text WHERE rowid = ?", row)
+                db.execute("DELETE FROM papers WHERE id = ?", row)
+
+    def keys(self):
+        with self._connect() as db:
+            return {key for key, in db.execute("SELECT key FROM papers")}
+
+    def search(self, query, categories, limit=MAX_LOCAL_RESULTS, offset=0):
+        match = build_match(query, categories)
+        if not match:
+            return []
+        weights = ", ".join(str(weight) for weight in COLUMN_WEIGHTS.values())
+        with stage("local_search") as event, self._connect() as db:
+            try:
+                rows = db.execute(
+                    f"SELECT papers.meta FROM paper_text JOIN papers ON papers.id = paper_text.rowid "
+                    f"WHERE paper_text MATCH ? ORDER BY bm25(paper_text, {weights}) LIMIT ? OFFSET ?",
+                    (match, limit, offset),
+                ).fetchall()
+            except sqlite3.OperationalError:
+                # Queries FTS5 can't parse find nothing locally, arXiv still gets them
+                rows = []
+            event["results"] = len(rows)
+        return [PaperRecord.from_dict(json.loads(meta)) for meta, in rows]
+
+
+# One index per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def get_local_index():
+    return LocalIndex()
+
+
+class LocalSearchPager:
+    # Pages through local hits with the same interface as the arXiv search pager
+
+    def __init__(self, query, categories, page_size):
+        self.query = query
+        self.categories = categories
+        self.page_size = page_size
+
+    def page(self, number):
+        return get_local_index().search(self.query, self.categories, self.page_size, number * self.page_size)
+
+    def has_page(self, number):
+        return number == 0 or bool(self.page(number))
+
+
+def merge_results(local, remote):
+    # Local hits first since they open instantly, arXiv results already among them are dropped
+    seen = {paper.entry_id for paper in local}
+    return local + [paper for paper in remote if paper.entry_id not in seen]
+
+
+def backfill(batch_size=100):
+    # Index papers converted before the index existed, their metadata is looked up on arXiv in batches
+    from arxiv_service import get_arxiv_service
+    from paper_cache import CACHE_DIR, MARKDOWN_NAME, paper_key
+
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    index = get_local_index()
+    known = index.keys()
+    missing = [
+        key for key in sorted(os.listdir(CACHE_DIR))
+        if key not in known and os.path.exists(os.path.join(CACHE_DIR, key, MARKDOWN_NAME))
+    ]
+
+    added = 0
+    for start in range(0, len(missing), batch_size):
+        # Keys are short ids with versions, old style ids had their slash replaced
+        ids = [key.replace("_", "/") for key in missing[start:start + batch_size]]
+        for paper in get_arxiv_service().get_papers(ids):
+            key = paper_key(paper)
+            try:
+                with open(os.path.join(CACHE_DIR, key, MARKDOWN_NAME), encoding="utf-8") as f:
+                    markdown = f.read()
+            except FileNotFoundError:
+                continue
+            index.add(key, paper, markdown)
+            added += 1
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the local full-text index of converted papers")
+    parser.add_argument("--backfill", action="store_true", help="Index cached papers that aren't indexed yet")
+    parser.add_argument("--search", help="Search the index and print the matching papers")
+    args = parser.parse_args(argv)
+
+    if args.backfill:
+        print(f"indexed {backfill()} papers")
+    if args.search:
+        for paper in get_local_index().search(args.search, []):
+            print(f"{paper.get_short_id()}\t{paper.title}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import math
+
+from batch_summarizer import load_batcher
+from metrics import stage
+from paper_index import split_sections
+from result_cache import get_result_cache, make_key
+from token_budget import fit_to_token_budget, model_input_budget, tokenizer_counter
+from utils import SUMMARIZER_BACKEND, SUMMARIZER_MODEL
+
+# Sections are split to roughly this many words before being fitted to the model's token window
+SECTION_WORDS = 600
+# Summary lengths in tokens for the chunk summaries and for each reduce step
+MAP_LENGTHS = (30, 120)
+REDUCE_LENGTHS = (60, 180)
+# Bumped whenever the chunking or reduce strategy changes, so old cached summaries stop matching
+ENGINE_VERSION = 1
+
+
+def _summarize_all(batcher, texts, lengths):
+    # Queue every text at once, the batcher runs them through the model in padded batches
+    futures = [batcher.submit(text, *lengths) for text in texts]
+    return [future.result() for future in futures]
+
+
+def _fit(texts, budget, count_tokens):
+    return [fit_to_token_budget(text, budget, count_tokens)[0] for text in texts]
+
+
+def map_reduce_summary(markdown, paragraphs):
+    batcher = load_batcher()
+    tokenizer = batcher.summarizer.tokenizer
+    budget = model_input_budget(tokenizer)
+    count_tokens = tokenizer_counter(tokenizer)
+
+    # Map, summarize every section sized chunk of the paper
+    chunks = _fit(split_sections(markdown, max_words=SECTION_WORDS), budget, count_tokens)
+    summaries = _summarize_all(batcher, chunks, MAP_LENGTHS)
+
+    # Reduce, merge neighbouring summaries and summarize them again until one is left per paragraph
+    while len(summaries) > paragraphs:
+        group_size = max(2, math.ceil(len(summaries) / paragraphs))
+        groups = [" ".join(summaries[i:i + group_size]) for i in range(0, len(summaries), group_size)]
+        summaries = _summarize_all(batcher, _fit(groups, budget, count_tokens), REDUCE_LENGTHS)
+
+    return "\n\n".join(summaries)
+
+
+def local_summary_cache_key(paper_id, paragraphs):
+    return make_key(
+        "local_paper_summary",
+        paper=paper_id,
+        model=SUMMARIZER_MODEL,
+        backend=SUMMARIZER_BACKEND,
+        engine=ENGINE_VERSION,
+        paragraphs=paragraphs,
+    )
+
+
+def summarize_paper_locally(paper_id, markdown, paragraphs):
+    # Local summaries are cached like the Gemini ones so heavy load doesn't redo them
+    cache = get_result_cache()
+    cache_key = local_summary_cache_key(paper_id, paragraphs)
+    summary = cache.get(cache_key)
+    if summary is None:
+        with stage("local_inference", engine="map_reduce", paragraphs=paragraphs):
+            summary = map_reduce_summary(markdown, paragraphs)
+        cache.put(cache_key, summary)
+    return summary
@@ -0,0 +1,123 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Every stage event is appended here as a JSON line when set
+METRICS_FILE = os.environ.get("PAPER_DISTILL_METRICS_FILE")
+# Serve the Prometheus text format on this port when set
+METRICS_PORT = os.environ.get("PAPER_DISTILL_METRICS_PORT")
+# Show a per-request timing breakdown in the sidebar, meant for operators
+OPERATOR_MODE = os.environ.get("PAPER_DISTILL_OPERATOR") == "1"
+
+# Aggregates for every stage since the process started
+_totals = {}
+_lock = threading.Lock()
+# Events recorded by the current streamlit script run, None outside of a traced run
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace():
+    # Collect the events recorded in this thread from here on, returns the list they are added to
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def record(event):
+    stage = event["stage"]
+    with _lock:
+        totals = _totals.setdefault(
+            stage, {"count": 0, "seconds": 0.0, "bytes": 0, "tokens": 0, "hits": 0, "misses": 0, "errors": 0}
+        )
+        totals["count"] += 1
+        totals["seconds"] += event.get("seconds", 0.0)
+        totals["bytes"] += event.get("bytes", 0)
+        totals["tokens"] += event.get("tokens", 0)
+        if event.get("cache") == "hit":
+            totals["hits"] += 1
+        elif event.get("cache") == "miss":
+            totals["misses"] += 1
+        if event.get("error"):
+            totals["errors"] += 1
+
+        if METRICS_FILE:
+            with open(METRICS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"time": time.time(), **event}) + "\n")
+
+    trace = _trace.get()
+    if trace is not None:
+        trace.append(event)
+
+
+@contextmanager
+def stage(name, **attrs):
+    # Time a pipeline stage, the caller can add bytes, tokens or cache ("hit"/"miss") to the yielded event
+    event = {"stage": name, **attrs}
+    start = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event["error"] = type(e).__name__
+        raise
+    finally:
+        event["seconds"] = time.perf_counter() - start
+        record(event)
+
+
+def record_cache(name, hit):
+    record({"stage": name, "cache": "hit" if hit else "miss", "seconds": 0.0})
+
+
+def snapshot():
+    with _lock:
+        return {stage: dict(totals) for stage, totals in _totals.items()}
+
+
+def render_prometheus():
+    lines = []
+    metrics = [
+        ("paper_distill_stage_calls_total", "counter", "count", "Times each pipeline stage ran"),
+        ("paper_distill_stage_seconds_total", "counter", "seconds", "Time spent in each pipeline stage"),
+        ("paper_distill_stage_bytes_total", "counter", "bytes", "Bytes handled by each pipeline stage"),
+        ("paper_distill_stage_tokens_total", "counter", "tokens", "Tokens handled by each pipeline stage"),
+        ("paper_distill_stage_errors_total", "counter", "errors", "Failed runs of each pipeline stage"),
+    ]
+    totals = snapshot()
+    for name, kind, field, help_text in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for stage_name, values in sorted(totals.items()):
+            lines.append(f'{name}{{stage="{stage_name}"}} {values[field]}')
+    lines.append("# HELP paper_distill_cache_requests_total Cache lookups per stage")
+    lines.append("# TYPE paper_distill_cache_requests_total counter")
+    for stage_name, values in sorted(totals.items()):
+        if values["hits"] or values["misses"]:
+            lines.append(f'paper_distill_cache_requests_total{{stage="{stage_name}",result="hit"}} {values["hits"]}')
+            lines.append(f'paper_distill_cache_requests_total{{stage="{stage_name}",result="miss"}} {values["misses"]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT):
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", int(port)), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
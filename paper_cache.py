@@ -0,0 +1,273 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from downloader import META_SUFFIX, get_downloader, last_checked
+from local_index import get_local_index
+from metrics import record, stage
+from pdf_convert import convert_pdf_to_markdown
+
+# Directory shared by every session for downloaded pdfs and their converted markdown
+CACHE_DIR = os.environ.get(
+    "PAPER_DISTILL_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".paper_cache"),
+)
+# Total size the cache may grow to before least recently used papers are evicted
+MAX_CACHE_BYTES = int(os.environ.get("PAPER_DISTILL_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# Cached pdfs are checked against arXiv again after this many seconds, by default never
+# since a versioned paper doesn't change, but arXiv does occasionally rebuild old pdfs
+PDF_REVALIDATE_SECONDS = os.environ.get("PAPER_DISTILL_PDF_REVALIDATE_SECONDS")
+
+PDF_NAME = "paper.pdf"
+MARKDOWN_NAME = "paper.md"
+
+# One lock per paper so concurrent sessions wait for a download in flight instead of starting another
+_key_locks = {}
+_key_locks_guard = threading.Lock()
+_evict_lock = threading.Lock()
+# Size of every cached paper's files and when each paper was last used, scanned from disk on first use
+# then kept up to date as files are written, touched and removed, so eviction never walks the cache
+_usage = None
+_usage_bytes = 0
+
+
+def paper_key(paper):
+    # arXiv versions never change once published, so the short id with its version addresses the content
+    # Old style ids contain a slash (e.g. hep-th/9901001v1) which can't be used in a directory name
+    return paper.get_short_id().replace("/", "_")
+
+
+def paper_dir(key):
+    return os.path.join(CACHE_DIR, key)
+
+
+def _key_lock(key):
+    with _key_locks_guard:
+        if key not in _key_locks:
+            _key_locks[key] = threading.RLock()
+        return _key_locks[key]
+
+
+@contextmanager
+def _waiting_for(key):
+    # Hold the paper's lock, time spent waiting for another session's work on the paper is recorded as a
+    # stage of its own so it isn't counted as part of the download or conversion that waited
+    lock = _key_lock(key)
+    if not lock.acquire(blocking=False):
+        with stage("paper_wait", paper=key):
+            lock.acquire()
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def paper_lock(paper):
+    # Held while building anything derived from a paper, so it is only built once and never evicted midway
+    return _key_lock(paper_key(paper))
+
+
+def _touch(key):
+    # Directory mtime doubles as the last access time used for LRU eviction
+    try:
+        os.utime(paper_dir(key))
+    except FileNotFoundError:
+        return
+    with _evict_lock:
+        entry = _load_usage().get(key)
+        if entry is not None:
+            entry["used"] = time.time()
+
+
+def _atomic_write(path, data):
+    # Write to a temp file in the same directory then rename it over the target,
+    # readers only ever see a missing file or a complete one
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        if isinstance(data, bytes):
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        else:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _record_file(path)
+
+
+def _file_sizes(path):
+    sizes = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            try:
+                sizes[os.path.relpath(file_path, path)] = os.path.getsize(file_path)
+            except FileNotFoundError:
+                pass
+    return sizes
+
+
+def _load_usage():
+    # Must be called with _evict_lock held
+    global _usage, _usage_bytes
+    if _usage is None:
+        _usage = {}
+        if os.path.isdir(CACHE_DIR):
+            for key in os.listdir(CACHE_DIR):
+                path = paper_dir(key)
+                if os.path.isdir(path):
+                    _usage[key] = {"used": os.path.getmtime(path), "files": _file_sizes(path)}
+        _usage_bytes = sum(sum(entry["files"].values()) for entry in _usage.values())
+    return _usage
+
+
+def _record_file(path):
+    # Count a file just written to a paper's directory, replacing what an earlier version of it took up
+    global _usage_bytes
+    key, name = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+    size = os.path.getsize(path)
+    with _evict_lock:
+        entry = _load_usage().setdefault(key, {"used": time.time(), "files": {}})
+        _usage_bytes += size - entry["files"].get(name, 0)
+        entry["files"][name] = size
+
+
+def _forget_file(path):
+    global _usage_bytes
+    key, name = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+    with _evict_lock:
+        entry = _load_usage().get(key)
+        if entry is not None:
+            _usage_bytes -= entry["files"].pop(name, 0)
+
+
+def _evict(keep=None):
+    global _usage_bytes
+    with _evict_lock:
+        usage = _load_usage()
+        if _usage_bytes <= MAX_CACHE_BYTES:
+            return
+
+        # Remove least recently used papers until the cache fits, skipping the one just written
+        # and any paper another session is currently working on
+        for key in sorted(usage, key=lambda k: usage[k]["used"]):
+            if _usage_bytes <= MAX_CACHE_BYTES:
+                break
+            if key == keep:
+                continue
+            lock = _key_lock(key)
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                shutil.rmtree(paper_dir(key), ignore_errors=True)
+                _unindex(key)
+                _usage_bytes -= sum(usage.pop(key)["files"].values())
+            finally:
+                lock.release()
+
+
+def _index(key, paper, markdown):
+    # Keep the local full-text index in step with the converted papers, search still works without it
+    try:
+        get_local_index().add(key, paper, markdown)
+    except Exception:
+        pass
+
+
+def _unindex(key):
+    try:
+        get_local_index().remove(key)
+    except Exception:
+        pass
+
+
+def artifact_path(paper, name):
+    return os.path.join(paper_dir(paper_key(paper)), name)
+
+
+def write_artifact(paper, name, data):
+    # Store something derived from the paper next to its pdf and markdown, evicted together with them
+    _atomic_write(artifact_path(paper, name), data)
+
+
+def has_markdown(paper):
+    return os.path.exists(os.path.join(paper_dir(paper_key(paper)), MARKDOWN_NAME))
+
+
+def _needs_revalidation(pdf_path):
+    return PDF_REVALIDATE_SECONDS is not None and time.time() - last_checked(pdf_path) > float(PDF_REVALIDATE_SECONDS)
+
+
+def _drop_derived(key):
+    # The pdf changed, everything converted or built from the old one is rebuilt from the new one
+    for name in os.listdir(paper_dir(key)):
+        if not name.startswith(PDF_NAME):
+            os.remove(os.path.join(paper_dir(key), name))
+            _forget_file(os.path.join(paper_dir(key), name))
+
+
+def get_pdf_path(paper):
+    key = paper_key(paper)
+    pdf_path = os.path.join(paper_dir(key), PDF_NAME)
+    with _waiting_for(key), stage("download", paper=key) as event:
+        event["cache"] = "hit"
+        existed = os.path.exists(pdf_path)
+        if not existed or _needs_revalidation(pdf_path):
+            os.makedirs(paper_dir(key), exist_ok=True)
+            # Streamed into paper.pdf.part through the shared downloader, which renames it once complete.
+            # A download cut short is resumed from the part file the next time the paper is asked for
+            result = get_downloader().download(paper.pdf_url, pdf_path, revalidate=existed)
+            event["revalidated"] = existed
+            if result["changed"]:
+                event["cache"] = "miss"
+                event["transferred"] = result["bytes"]
+                event["resumed"] = result["resumed"]
+                if existed:
+                    _drop_derived(key)
+                # The downloader writes these itself rather than through _atomic_write
+                _record_file(pdf_path)
+                _record_file(pdf_path + META_SUFFIX)
+                _evict(keep=key)
+        _touch(key)
+        event["bytes"] = os.path.getsize(pdf_path)
+    return pdf_path
+
+
+def get_markdown(paper, workers=None):
+    # workers is the number of processes a conversion is sharded across, CONVERT_WORKERS by default
+    key = paper_key(paper)
+    md_path = os.path.join(paper_dir(key), MARKDOWN_NAME)
+
+    # Fast path, markdown is already cached so skip both the download and the conversion
+    try:
+        with open(md_path, encoding="utf-8") as f:
+            markdown = f.read()
+        record({"stage": "convert", "paper": key, "cache": "hit", "bytes": len(markdown), "seconds": 0.0})
+        _touch(key)
+        return markdown
+    except FileNotFoundError:
+        pass
+
+    with _waiting_for(key):
+        # Another session may have finished converting while we waited for the lock
+        if os.path.exists(md_path):
+            with open(md_path, encoding="utf-8") as f:
+                markdown = f.read()
+        else:
+            pdf_path = get_pdf_path(paper)
+            with stage("convert", paper=key, cache="miss") as event:
+                markdown = convert_pdf_to_markdown(pdf_path, workers)
+                event["bytes"] = len(markdown)
+            _atomic_write(md_path, markdown)
+            _index(key, paper, markdown)
+            _evict(keep=key)
+        _touch(key)
+    return markdown
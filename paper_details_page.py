@@ -1,93 +1,113 @@
 import streamlit as st
-from nltk import sent_tokenize
-from google import genai
-from google.genai import types
-import pymupdf4llm
-from utils import load_summarizer
-from search_page import categories_dict
+from batch_summarizer import summarize_abstracts
+from gemini_client import get_genai_client, hold_paper_context, paper_summary_cache_key, release_paper_context
+from jobs import (
+    JOB_POLL_SECONDS,
+    PREPARING,
+    QUEUED,
+    RUNNING,
+    WAITING,
+    answer_cache_key,
+    get_job_queue,
+    submit_local_summary,
+    submit_paper_summary,
+    submit_question,
+)
+from local_summary import local_summary_cache_key
+from paper_cache import paper_key
+from result_cache import get_result_cache
 
 # If no paper is selected, navigate back to search page
 if st.session_state.selected_paper is None:
     st.switch_page("search_page.py")
 
+# Creating google gen AI client
+client = get_genai_client(st.secrets["google_ai_studio_api_key"])
+
 # If back button is pressed, set selected paper to None and rerun, taking user back to search page
 if st.button("Back to search"):
+    # Jobs this session started keep running, their results land in the shared result cache
     st.session_state.selected_paper = None
+    release_paper_context(client, st.session_state)
     st.rerun()
 
 # Putting currently selected paper into a shorter var name
 paper = st.session_state.selected_paper
 
-def paper_pdf_to_markdown():
-    # Download paper from arxiv result stored in session state
-    paper.download_pdf(filename="paper.pdf")
-    # Convert pdf to markdown text and return it
-    paper_as_markdown = pymupdf4llm.to_markdown("paper.pdf")
-    return paper_as_markdown
+# Keep the paper's provider side context while this session has it open, another paper releases it
+hold_paper_context(client, st.session_state, paper_key(paper))
 
-# Load summarization model which is stored in streamlit cache
-summarizer = load_summarizer()
 def summarize_abstract(length):
-
-    # Get abstract and its length from paper
-    abstract = paper.summary
-    abstract_length = len(abstract.split())
-
-    # Convert length from percentage to number of words and return an iteger
-    length = round(length / 100 * abstract_length)
-
-    # If abstract is longer than 900 words, shorten it to 900 words
-    # This is because the model only has 1024 positional embeddings
-    if abstract_length > 900:
-        sentences = sent_tokenize(abstract)
-        shortened_abstract = ""
-        word_count = 0
-
-        for sentence in sentences:
-            words = sentence.split()
-            if word_count + len(words) <= 900:
-                shortened_abstract += sentence + " "
-                word_count += len(words)
-            else:
-                break
-        abstract = shortened_abstract
-
-    # Generate abstract summary with a length padding of 10 in each direction
-    # This is to give the model some leeway in generating the summary
-    summary = summarizer(
-        abstract, max_length=length + 10, min_length=length - 10, do_sample=False
-    )[0]["summary_text"]
+    # Send the abstract through the shared batcher, which combines it with
+    # other sessions' requests into a single forward pass of the model
+    summary = summarize_abstracts([paper.summary], length)[0]
     # Save abstract summary into session state
     st.session_state.abstract_summary = summary
 
-# Creating google gen AI client
-client = genai.Client(api_key=st.secrets["google_ai_studio_api_key"])
+# Progress shown while a job runs, by job status
+JOB_STATUS = {
+    QUEUED: "Queued...",
+    PREPARING: "Downloading and converting the paper...",
+    WAITING: "Waiting for a free slot with the model...",
+    RUNNING: "Generating...",
+}
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def poll_job(job):
+    # Show the job's progress and the response so far, only this fragment reruns until the job finishes,
+    # then the whole page reruns to pick up the result
+    if job.done:
+        st.rerun()
+    st.caption(JOB_STATUS.get(job.status, "Finishing..."))
+    st.markdown(job.text)
+
+def collect_job(job_state, result_state):
+    # Store this session's job under job_state in result_state once it has finished, rendering its progress
+    # until then. Jobs run in the shared job queue, so they carry on through reruns and while the user browses elsewhere
+    key = st.session_state[job_state]
+    if key is None:
+        return
+    job = get_job_queue().get(key)
+    if job is None:
+        # Finished so long ago the queue forgot it, the job key is its result cache key and complete results are cached
+        st.session_state[job_state] = None
+        st.session_state[result_state] = get_result_cache().get(key)
+        if st.session_state[result_state] is None:
+            st.warning("This response didn't finish and is no longer available, please try again.")
+        return
+    if not job.done:
+        poll_job(job)
+        return
+    st.session_state[job_state] = None
+    if job.error is not None:
+        st.error(f"The response was interrupted: {job.error}")
+    # The complete result, or as much of the response as arrived before a failure
+    st.session_state[result_state] = job.result if job.error is None else job.text or None
 
 def summarize_paper(length, complexity):
-    # System instructions
-    sys_instruct = f"Condense this academic paper into a summary with a length of {length} paragraphs. Write it using vocabulary terms and explanations appropriate for a {complexity} student, but still keep it informative and professional. Do not add any formatting or introduction, simply return the requested number of paragraphs of summarized content."
-    
-    # Calling the google genai client with system instructions and paper as markdown
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        config=types.GenerateContentConfig(
-            system_instruction=sys_instruct),
-        contents=[paper_pdf_to_markdown()]
-    )
-    # Saving response into session state
-    st.session_state.paper_summary = response.text
+    # Summaries are shared across sessions, another user may already have generated this one
+    cached = get_result_cache().get(paper_summary_cache_key(paper_key(paper), length, complexity))
+    if cached is not None:
+        st.session_state.paper_summary = cached
+        return
+    st.session_state.paper_summary = None
+    st.session_state.paper_summary_job = submit_paper_summary(client, paper, length, complexity).key
+
+def summarize_paper_offline(length):
+    cached = get_result_cache().get(local_summary_cache_key(paper_key(paper), length))
+    if cached is not None:
+        st.session_state.paper_summary = cached
+        return
+    st.session_state.paper_summary = None
+    st.session_state.paper_summary_job = submit_local_summary(paper, length).key
 
 def answer_question(question):
-    # Calling the google genai client with system instructions and paper as markdown
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        config=types.GenerateContentConfig(
-            system_instruction="You are extremely knowledgeable about the paper in question, answer the question based on what you know about the paper, politley decline any request not related to the paper. At the end of your response suggest 3 related questions to be asked.",
-        ),
-        contents=[paper_pdf_to_markdown(), question]
-    )
-    # Returning the response
-    return response.text
+    cached = get_result_cache().get(answer_cache_key(paper_key(paper), question))
+    if cached is not None:
+        st.session_state.answer = cached
+        return
+    st.session_state.answer = None
+    st.session_state.answer_job = submit_question(client, paper, question).key
 
 # Basic info about paper
 with st.container():
@@ -95,20 +115,14 @@ with st.container():
     st.header(paper.title)
 
     # Authors section
-    authors_text = ", ".join([a.name for a in paper.authors][:3])
-    if len(paper.authors) > 3:
-        authors_text += " et al."
-    st.markdown(f"**Authors:** *{authors_text}*")
+    st.markdown(f"**Authors:** *{paper.authors_text}*")
 
 
 col1, col2 = st.columns(2)
 with col1:
-    st.markdown(f"**Published:** {paper.published.strftime('%Y-%m-%d')}")
+    st.markdown(f"**Published:** {paper.published}")
 with col2:
-    # Convert codes to display names before joining
-    display_categories = [categories_dict.get(cat, cat) for cat in paper.categories]
-    categories_display = ", ".join(display_categories)
-    st.markdown(f"**Categories:** {categories_display}")
+    st.markdown(f"**Categories:** {paper.categories_text}")
 st.markdown(
     f"**Links:** [PDF]({paper.pdf_url}) | [arXiv]({paper.entry_id})"
 )
@@ -143,23 +157,32 @@ with tabs[2]:
             "Graduate",
             "PhD",
         ])
-    # Handle submit button, call summarize_paper with parameters which updates session state
+    # Gemini or the fully offline map-reduce summary with the local model
+    engine = st.radio("Summary Engine", ["Gemini", "Local model"], horizontal=True)
+    if engine == "Local model":
+        st.caption("The local model summarizes each section of the paper, then summarizes those summaries down to the requested number of paragraphs. It runs offline but does not adjust to the selected complexity.")
+
+    # Handle submit button, the summary is generated in the background and shown here as it streams in
     if st.button("Generate Paper Summary", key="paper_summary_button"):
-        with st.spinner(f"Generating {technical_complexity} level paper summary..."):
+        if engine == "Local model":
+            summarize_paper_offline(length)
+        else:
             summarize_paper(length, technical_complexity)
+    collect_job("paper_summary_job", "paper_summary")
     # If there has been a sumary generated and stored in session state, display it
-    if st.session_state.paper_summary is not None:
+    if st.session_state.paper_summary_job is None and st.session_state.paper_summary is not None:
         st.markdown(st.session_state.paper_summary)
 
 # Ask questions tab
 with tabs[3]:
     # Get user input for question
     question = st.text_input("Ask a question about the paper(or ask what are good questions to ask)", max_chars=500)
-    # If question is asked, call google genai client with prompt and paper as markdown
+    # If question is asked, answer it in the background from the parts of the paper most relevant to it
     if st.button("Ask", key="ask_button"):
         if question != "":
-            with st.spinner("Generating answer..."):
-                answer = answer_question(question)
-                st.markdown(answer)
+            answer_question(question)
         else:
             st.warning("Please enter a question.")
+    collect_job("answer_job", "answer")
+    if st.session_state.answer_job is None and st.session_state.answer is not None:
+        st.markdown(st.session_state.answer)
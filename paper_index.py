@@ -0,0 +1,148 @@
+import io
+import json
+import os
+import re
+
+import numpy as np
+import requests
+import streamlit as st
+
+from paper_cache import artifact_path, paper_lock, write_artifact
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# When set, embeddings come from this HTTP endpoint instead of the local model (used by offline tests)
+# It receives {"texts": [...]} and returns {"embeddings": [[...], ...]}
+EMBEDDING_URL = os.environ.get("PAPER_DISTILL_EMBEDDING_URL")
+# Chunks longer than this are split on paragraph boundaries
+MAX_CHUNK_WORDS = 300
+# Number of chunks sent with each question
+TOP_K = 6
+
+CHUNKS_NAME = "chunks.json"
+EMBEDDINGS_NAME = "embeddings.npy"
+
+HEADING = re.compile(r"^#{1,6} ")
+
+
+def split_sections(markdown, max_words=MAX_CHUNK_WORDS):
+    # Split the paper on its markdown headings
+    sections = []
+    heading, lines = "", []
+    for line in markdown.splitlines():
+        if HEADING.match(line):
+            sections.append((heading, "\n".join(lines)))
+            heading, lines = line.lstrip("#").strip(), []
+        else:
+            lines.append(line)
+    sections.append((heading, "\n".join(lines)))
+
+    # Break long sections into chunks of whole paragraphs, each labelled with its section heading
+    chunks = []
+    for heading, body in sections:
+        current, words = [], 0
+        for paragraph in re.split(r"\n\s*\n", body):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            count = len(paragraph.split())
+            if current and words + count > max_words:
+                chunks.append(_chunk(heading, current))
+                current, words = [], 0
+            current.append(paragraph)
+            words += count
+        if current:
+            chunks.append(_chunk(heading, current))
+    return chunks
+
+
+def _chunk(heading, paragraphs):
+    body = "\n\n".join(paragraphs)
+    return f"## {heading}\n\n{body}" if heading else body
+
+
+def _embed_remote(texts):
+    response = requests.post(EMBEDDING_URL, json={"texts": texts}, timeout=60)
+    response.raise_for_status()
+    return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+
+# Load the embedding model from hugging face, it is small enough to run on cpu next to the summarizer
+@st.cache_resource
+def load_embedder():
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(EMBEDDING_MODEL)
+    model = AutoModel.from_pretrained(EMBEDDING_MODEL).eval()
+
+    def embed_batch(texts, batch_size=32):
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            inputs = tokenizer(
+                texts[start:start + batch_size], padding=True, truncation=True, max_length=256, return_tensors="pt"
+            )
+            with torch.no_grad():
+                hidden = model(**inputs).last_hidden_state
+            # Mean pool over the real tokens only
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            vectors.append(((hidden * mask).sum(1) / mask.sum(1)).numpy())
+        return np.concatenate(vectors).astype(np.float32)
+
+    return embed_batch
+
+
+def embed(texts):
+    vectors = _embed_remote(texts) if EMBEDDING_URL else load_embedder()(texts)
+    # Normalize so a dot product is the cosine similarity
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _embedding_source():
+    return EMBEDDING_URL or EMBEDDING_MODEL
+
+
+def _load_index(paper):
+    try:
+        with open(artifact_path(paper, CHUNKS_NAME), encoding="utf-8") as f:
+            meta = json.load(f)
+        embeddings = np.load(artifact_path(paper, EMBEDDINGS_NAME))
+    except (FileNotFoundError, ValueError):
+        return None
+    # An index built with a different embedding model can't be searched with this one
+    if meta.get("model") != _embedding_source() or len(meta["chunks"]) != len(embeddings):
+        return None
+    return meta["chunks"], embeddings
+
+
+def get_index(paper, markdown):
+    index = _load_index(paper)
+    if index is not None:
+        return index
+
+    with paper_lock(paper):
+        # Another session may have built the index while we waited for the lock
+        index = _load_index(paper)
+        if index is not None:
+            return index
+
+        chunks = split_sections(markdown)
+        embeddings = embed(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+
+        # Embeddings are written first, the chunks file marks the index as complete
+        buffer = io.BytesIO()
+        np.save(buffer, embeddings)
+        write_artifact(paper, EMBEDDINGS_NAME, buffer.getvalue())
+        write_artifact(paper, CHUNKS_NAME, json.dumps({"model": _embedding_source(), "chunks": chunks}))
+    return chunks, embeddings
+
+
+def top_chunks(paper, markdown, question, k=TOP_K):
+    chunks, embeddings = get_index(paper, markdown)
+    if len(chunks) <= k:
+        return chunks
+
+    scores = embeddings @ embed([question])[0]
+    best = np.argpartition(-scores, k)[:k]
+    # Keep the chosen chunks in the order they appear in the paper
+    return [chunks[i] for i in sorted(best)]
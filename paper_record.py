@@ -0,0 +1,69 @@
+import sys
+
+from categories import categories_dict
+
+# Authors shown before the list is cut short with "et al."
+MAX_AUTHORS_SHOWN = 3
+
+
+class PaperRecord:
+    # What sessions keep for a paper instead of an arxiv.Result, which also carries its links, author
+    # objects and the raw feed entry. Display strings are built once when the paper is fetched, and records
+    # are shared between sessions through the arxiv service's cache so they must never be modified
+    __slots__ = (
+        "entry_id", "short_id", "title", "summary", "authors", "published", "categories", "pdf_url",
+        "authors_text", "categories_text",
+    )
+
+    def __init__(self, entry_id, short_id, title, summary, authors, published, categories, pdf_url):
+        self.entry_id = entry_id
+        self.short_id = short_id
+        self.title = title
+        self.summary = summary
+        self.authors = tuple(authors)
+        # Publication date as YYYY-MM-DD, the only way the pages show it
+        self.published = published
+        # Category codes repeat across thousands of papers, interning keeps one copy of each
+        self.categories = tuple(sys.intern(cat) for cat in categories)
+        self.pdf_url = pdf_url
+
+        self.authors_text = ", ".join(self.authors[:MAX_AUTHORS_SHOWN])
+        if len(self.authors) > MAX_AUTHORS_SHOWN:
+            self.authors_text += " et al."
+        self.categories_text = ", ".join(categories_dict.get(cat, cat) for cat in self.categories)
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(
+            entry_id=result.entry_id,
+            short_id=result.get_short_id(),
+            title=result.title,
+            summary=result.summary,
+            authors=[author.name for author in result.authors],
+            published=result.published.strftime("%Y-%m-%d"),
+            categories=result.categories,
+            pdf_url=result.pdf_url,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def to_dict(self):
+        return {
+            "entry_id": self.entry_id,
+            "short_id": self.short_id,
+            "title": self.title,
+            "summary": self.summary,
+            "authors": list(self.authors),
+            "published": self.published,
+            "categories": list(self.categories),
+            "pdf_url": self.pdf_url,
+        }
+
+    def get_short_id(self):
+        # Same name as arxiv.Result's, so either can be passed to the artifact cache
+        return self.short_id
+
+    def __repr__(self):
+        return f"PaperRecord({self.short_id!r}, {self.title!r})"
@@ -0,0 +1,80 @@
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Papers shorter than this are converted in process, the pool overhead isn't worth it for them
+MIN_PARALLEL_PAGES = int(os.environ.get("PAPER_DISTILL_MIN_PARALLEL_PAGES", 8))
+# Smallest page range handed to a single worker
+MIN_SHARD_PAGES = 2
+CONVERT_WORKERS = int(os.environ.get("PAPER_DISTILL_CONVERT_WORKERS", os.cpu_count() or 1))
+
+# Process pools by worker count, the app only ever uses one but the CLI and benchmarks can ask for others
+_pools = {}
+_pool_lock = threading.Lock()
+
+# Each worker process keeps the last document it opened, shards of the same paper reuse it
+_worker_doc = None
+_worker_doc_key = None
+
+
+def _get_pool(workers):
+    with _pool_lock:
+        if workers not in _pools:
+            # Spawn rather than fork, the streamlit server is multi-threaded
+            _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pools[workers]
+
+
+def _open_in_worker(pdf_path):
+    global _worker_doc, _worker_doc_key
+    import pymupdf
+
+    key = (pdf_path, os.path.getmtime(pdf_path))
+    if _worker_doc_key != key:
+        if _worker_doc is not None:
+            _worker_doc.close()
+        _worker_doc = pymupdf.open(pdf_path)
+        _worker_doc_key = key
+    return _worker_doc
+
+
+def _convert_shard(pdf_path, start, stop, hdr_info):
+    import pymupdf4llm
+
+    doc = _open_in_worker(pdf_path)
+    return pymupdf4llm.to_markdown(doc, pages=list(range(start, stop)), hdr_info=hdr_info)
+
+
+def page_ranges(page_count, shards):
+    # Split pages 0..page_count into at most `shards` contiguous (start, stop) ranges
+    size = max(MIN_SHARD_PAGES, math.ceil(page_count / max(shards, 1)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+
+def convert_pdf_to_markdown(pdf_path, workers=None):
+    # pymupdf4llm is slow to import, it is only loaded once a paper is converted
+    import pymupdf
+    import pymupdf4llm
+
+    workers = workers or CONVERT_WORKERS
+    with pymupdf.open(pdf_path) as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < MIN_PARALLEL_PAGES:
+            return pymupdf4llm.to_markdown(doc)
+
+        # Header levels come from font sizes across the whole document, work them out once here
+        # so every shard marks up headers exactly like the serial conversion would
+        hdr_info = pymupdf4llm.IdentifyHeaders(doc)
+
+    # Two shards per worker keeps every core busy when some page ranges are heavier than others
+    ranges = page_ranges(page_count, workers * 2)
+    pool = _get_pool(workers)
+    futures = [pool.submit(_convert_shard, pdf_path, start, stop, hdr_info) for start, stop in ranges]
+
+    # Stitch the shards back together in page order
+    return "".join(future.result() for future in futures)
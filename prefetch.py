@@ -0,0 +1,89 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from paper_cache import get_markdown, get_pdf_path, has_markdown, paper_key
+
+# How many of the top search results are downloaded and converted ahead of time
+PREFETCH_TOP_N = int(os.environ.get("PAPER_DISTILL_PREFETCH_TOP_N", 3))
+# Worker threads shared by every session, keeps the number of parallel arXiv downloads bounded
+PREFETCH_WORKERS = int(os.environ.get("PAPER_DISTILL_PREFETCH_WORKERS", 2))
+
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+# Papers currently queued or being prefetched by any session
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+class _Prefetch:
+    # One paper queued or being prefetched, shared by every batch that asked for it while it was in flight
+
+    def __init__(self):
+        self.batches = set()
+        self.future = None
+
+    def wanted(self):
+        # Must be called with _in_flight_lock held
+        return any(not batch.cancelled.is_set() for batch in self.batches)
+
+
+class PrefetchBatch:
+    # Prefetch jobs started by one search, cancelled together when a newer search replaces it
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.prefetches = []
+
+    def cancel(self):
+        self.cancelled.set()
+        # Papers another session's batch still wants carry on, the rest stop being shared
+        unwanted = []
+        with _in_flight_lock:
+            for key, prefetch in self.prefetches:
+                if not prefetch.wanted():
+                    if _in_flight.get(key) is prefetch:
+                        del _in_flight[key]
+                    unwanted.append(prefetch.future)
+        # Jobs still waiting in the queue are dropped, running ones stop at the next stage boundary
+        for future in unwanted:
+            future.cancel()
+
+
+def _wanted(prefetch):
+    with _in_flight_lock:
+        return prefetch.wanted()
+
+
+def _prefetch(paper, prefetch):
+    if not _wanted(prefetch) or has_markdown(paper):
+        return
+    get_pdf_path(paper)
+    if not _wanted(prefetch):
+        return
+    get_markdown(paper)
+
+
+def _forget(key, prefetch):
+    with _in_flight_lock:
+        if _in_flight.get(key) is prefetch:
+            del _in_flight[key]
+
+
+def prefetch_papers(papers, top_n=PREFETCH_TOP_N):
+    batch = PrefetchBatch()
+    for paper in papers[:top_n]:
+        key = paper_key(paper)
+        with _in_flight_lock:
+            # Another session may already be fetching this paper, this batch joins it rather than
+            # starting another and the paper is only dropped once every batch that wants it is cancelled
+            prefetch = _in_flight.get(key)
+            started = prefetch is None
+            if started:
+                prefetch = _Prefetch()
+                prefetch.future = _executor.submit(_prefetch, paper, prefetch)
+                _in_flight[key] = prefetch
+            prefetch.batches.add(batch)
+        if started:
+            prefetch.future.add_done_callback(lambda _, key=key, prefetch=prefetch: _forget(key, prefetch))
+        batch.prefetches.append((key, prefetch))
+    return batch
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import streamlit as st
+
+from metrics import record_cache
+
+# Results generated by the models, shared across sessions and restarts
+RESULT_CACHE_PATH = os.environ.get(
+    "PAPER_DISTILL_RESULT_CACHE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".result_cache.sqlite"),
+)
+RESULT_TTL_SECONDS = int(os.environ.get("PAPER_DISTILL_RESULT_TTL", 7 * 24 * 3600))
+# Total size of stored results before the least recently used ones are evicted
+MAX_RESULT_BYTES = int(os.environ.get("PAPER_DISTILL_RESULT_CACHE_MAX_BYTES", 64 * 1024 ** 2))
+
+
+def template_hash(template):
+    # Editing a prompt changes its hash, so results generated from the old prompt stop matching
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+
+def normalize_question(question):
+    # Repeat questions differing only in case, spacing or trailing punctuation share an answer
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+
+def make_key(kind, **parts):
+    payload = json.dumps({"kind": kind, **parts}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, path=RESULT_CACHE_PATH, ttl=RESULT_TTL_SECONDS, max_bytes=MAX_RESULT_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+
+    def _connect(self):
+        # A connection per call keeps the cache usable from any thread
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM results WHERE key = ? AND created > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+        self._count(row is not None)
+        record_cache("result_cache", row is not None)
+        return row[0] if row is not None else None
+
+    def put(self, key, value):
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        db.execute("DELETE FROM results WHERE created <= ?", (now - self.ttl,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk from the least recently used result until enough space has been freed
+        excess = total - self.max_bytes
+        stale = []
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY accessed"):
+            if excess <= 0:
+                break
+            stale.append((key,))
+            excess -= size
+        db.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def stats(self):
+        with self._connect() as db:
+            entries, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+# One cache per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
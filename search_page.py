@@ -1,29 +1,48 @@
 import streamlit as st
-import arxiv
-
-# Initialize arxiv client
-client = arxiv.Client()
-
-def fetch_papers(query, categories, max_results=10):
-    # Add categories to query if there are any
-    if categories:
-        cat_query = " OR ".join([f"cat:{cat}" for cat in categories])
-        query = f"{query} AND ({cat_query})" if query else cat_query
-
-    # Perform API call and cache in session state
-    search = arxiv.Search(
-        query=query, max_results=max_results, sort_by=arxiv.SortCriterion.SubmittedDate
-    )
-    results = list(client.results(search))
+from categories import categories_dict
+from arxiv_service import get_arxiv_service
+from prefetch import prefetch_papers
+from batch_summarizer import summarize_abstracts
+from local_index import LocalSearchPager, get_local_index, merge_results
+from utils import show_paper_details
+
+SEARCH_EVERYWHERE = "arXiv and papers we already have"
+SEARCH_LOCAL = "Only papers we already have"
+
+def fetch_papers(query, categories, page_size=10, local_only=False):
+    if local_only:
+        # Instant search over papers this deployment has already converted, arXiv isn't asked at all
+        st.session_state.search_pager = LocalSearchPager(query, categories, page_size)
+        st.session_state.local_papers = []
+    else:
+        # Local hits take milliseconds and lead the first page of the arXiv results
+        st.session_state.local_papers = get_local_index().search(query, categories)
+        # Start a paginated search through the shared arxiv service, only the first page is fetched now
+        st.session_state.search_pager = get_arxiv_service().paginate(query, categories, page_size)
+    st.session_state.abstract_summaries = {}
+    return show_results_page(0)
+
+
+def show_results_page(number):
+    # Fetch the page if it hasn't been already and cache its results in session state
+    results = st.session_state.search_pager.page(number)
+    # Results are merged by entry id, a paper found both locally and on arXiv is only listed once
+    local = st.session_state.local_papers
+    if number == 0:
+        results = merge_results(local, results)
+    else:
+        local_ids = {paper.entry_id for paper in local}
+        results = [paper for paper in results if paper.entry_id not in local_ids]
+    st.session_state.page_number = number
     st.session_state.papers = results
 
-    return results
-
-
-def show_paper_details(paper):
-    st.session_state.selected_paper = paper
-    st.switch_page("paper_details_page.py")
+    # Anything still prefetching for the previous page is superseded by this one
+    if st.session_state.prefetch_batch is not None:
+        st.session_state.prefetch_batch.cancel()
+    # Start downloading and converting the top results while the user reads the list
+    st.session_state.prefetch_batch = prefetch_papers(results)
 
+    return results
 
 
 # Search interface and title
@@ -31,198 +50,6 @@ st.title("Paper Distill")
 st.write("Search for scientific papers and get customized summarization and the ability to ask questions about the paper.")
 
 search_query = st.text_input("Search", placeholder="Enter keywords")
-# Complete ArXiv Categories Dictionary
-# Maps category codes to user-friendly display names
-
-categories_dict = {
-    # Computer Science
-    "cs.AI": "Artificial Intelligence",
-    "cs.AR": "Hardware Architecture",
-    "cs.CC": "Computational Complexity",
-    "cs.CE": "Computational Engineering, Finance, and Science",
-    "cs.CG": "Computational Geometry",
-    "cs.CL": "Computational Linguistics",
-    "cs.CR": "Cryptography and Security",
-    "cs.CV": "Computer Vision and Pattern Recognition",
-    "cs.CY": "Computers and Society",
-    "cs.DB": "Databases",
-    "cs.DC": "Distributed, Parallel, and Cluster Computing",
-    "cs.DL": "Digital Libraries",
-    "cs.DM": "Discrete Mathematics",
-    "cs.DS": "Data Structures and Algorithms",
-    "cs.ET": "Emerging Technologies",
-    "cs.FL": "Formal Languages and Automata Theory",
-    "cs.GL": "General Literature",
-    "cs.GR": "Graphics",
-    "cs.GT": "Computer Science and Game Theory",
-    "cs.HC": "Human-Computer Interaction",
-    "cs.IR": "Information Retrieval",
-    "cs.IT": "Information Theory",
-    "cs.LG": "Machine Learning",
-    "cs.LO": "Logic in Computer Science",
-    "cs.MA": "Multiagent Systems",
-    "cs.MM": "Multimedia",
-    "cs.MS": "Mathematical Software",
-    "cs.NA": "Numerical Analysis",
-    "cs.NE": "Neural and Evolutionary Computing",
-    "cs.NI": "Networking and Internet Architecture",
-    "cs.OH": "Other Computer Science",
-    "cs.OS": "Operating Systems",
-    "cs.PF": "Performance",
-    "cs.PL": "Programming Languages",
-    "cs.RO": "Robotics",
-    "cs.SC": "Symbolic Computation",
-    "cs.SD": "Sound",
-    "cs.SE": "Software Engineering",
-    "cs.SI": "Social and Information Networks",
-    "cs.SY": "Systems and Control",
-    
-    # Economics
-    "econ.EM": "Econometrics",
-    "econ.GN": "General Economics",
-    "econ.TH": "Theoretical Economics",
-    
-    # Electrical Engineering and Systems Science
-    "eess.AS": "Audio and Speech Processing",
-    "eess.IV": "Image and Video Processing",
-    "eess.SP": "Signal Processing",
-    "eess.SY": "Systems and Control",
-    
-    # Mathematics
-    "math.AC": "Commutative Algebra",
-    "math.AG": "Algebraic Geometry",
-    "math.AP": "Analysis of PDEs",
-    "math.AT": "Algebraic Topology",
-    "math.CA": "Classical Analysis and ODEs",
-    "math.CO": "Combinatorics",
-    "math.CT": "Category Theory",
-    "math.CV": "Complex Variables",
-    "math.DG": "Differential Geometry",
-    "math.DS": "Dynamical Systems",
-    "math.FA": "Functional Analysis",
-    "math.GM": "General Mathematics",
-    "math.GN": "General Topology",
-    "math.GR": "Group Theory",
-    "math.GT": "Geometric Topology",
-    "math.HO": "History and Overview",
-    "math.IT": "Information Theory",
-    "math.KT": "K-Theory and Homology",
-    "math.LO": "Logic",
-    "math.MG": "Metric Geometry",
-    "math.MP": "Mathematical Physics",
-    "math.NA": "Numerical Analysis",
-    "math.NT": "Number Theory",
-    "math.OA": "Operator Algebras",
-    "math.OC": "Optimization and Control",
-    "math.PR": "Probability",
-    "math.QA": "Quantum Algebra",
-    "math.RA": "Rings and Algebras",
-    "math.RT": "Representation Theory",
-    "math.SG": "Symplectic Geometry",
-    "math.SP": "Spectral Theory",
-    "math.ST": "Statistics Theory",
-    
-    # Astrophysics
-    "astro-ph.CO": "Cosmology and Nongalactic Astrophysics",
-    "astro-ph.EP": "Earth and Planetary Astrophysics",
-    "astro-ph.GA": "Astrophysics of Galaxies",
-    "astro-ph.HE": "High Energy Astrophysical Phenomena",
-    "astro-ph.IM": "Instrumentation and Methods for Astrophysics",
-    "astro-ph.SR": "Solar and Stellar Astrophysics",
-    
-    # Condensed Matter
-    "cond-mat.dis-nn": "Disordered Systems and Neural Networks",
-    "cond-mat.mes-hall": "Mesoscale and Nanoscale Physics",
-    "cond-mat.mtrl-sci": "Materials Science",
-    "cond-mat.other": "Other Condensed Matter",
-    "cond-mat.quant-gas": "Quantum Gases",
-    "cond-mat.soft": "Soft Condensed Matter",
-    "cond-mat.stat-mech": "Statistical Mechanics",
-    "cond-mat.str-el": "Strongly Correlated Electrons",
-    "cond-mat.supr-con": "Superconductivity",
-    
-    # General Relativity and Quantum Cosmology
-    "gr-qc": "General Relativity and Quantum Cosmology",
-    
-    # High Energy Physics
-    "hep-ex": "High Energy Physics - Experiment",
-    "hep-lat": "High Energy Physics - Lattice",
-    "hep-ph": "High Energy Physics - Phenomenology",
-    "hep-th": "High Energy Physics - Theory",
-    
-    # Mathematical Physics
-    "math-ph": "Mathematical Physics",
-    
-    # Nonlinear Sciences
-    "nlin.AO": "Adaptation and Self-Organizing Systems",
-    "nlin.CD": "Chaotic Dynamics",
-    "nlin.CG": "Cellular Automata and Lattice Gases",
-    "nlin.PS": "Pattern Formation and Solitons",
-    "nlin.SI": "Exactly Solvable and Integrable Systems",
-    
-    # Nuclear Experiment and Theory
-    "nucl-ex": "Nuclear Experiment",
-    "nucl-th": "Nuclear Theory",
-    
-    # Physics
-    "physics.acc-ph": "Accelerator Physics",
-    "physics.ao-ph": "Atmospheric and Oceanic Physics",
-    "physics.app-ph": "Applied Physics",
-    "physics.atm-clus": "Atomic and Molecular Clusters",
-    "physics.atom-ph": "Atomic Physics",
-    "physics.bio-ph": "Biological Physics",
-    "physics.chem-ph": "Chemical Physics",
-    "physics.class-ph": "Classical Physics",
-    "physics.comp-ph": "Computational Physics",
-    "physics.data-an": "Data Analysis, Statistics and Probability",
-    "physics.ed-ph": "Physics Education",
-    "physics.flu-dyn": "Fluid Dynamics",
-    "physics.gen-ph": "General Physics",
-    "physics.geo-ph": "Geophysics",
-    "physics.hist-ph": "History and Philosophy of Physics",
-    "physics.ins-det": "Instrumentation and Detectors",
-    "physics.med-ph": "Medical Physics",
-    "physics.optics": "Optics",
-    "physics.plasm-ph": "Plasma Physics",
-    "physics.pop-ph": "Popular Physics",
-    "physics.soc-ph": "Physics and Society",
-    "physics.space-ph": "Space Physics",
-    
-    # Quantum Physics
-    "quant-ph": "Quantum Physics",
-    
-    # Quantitative Biology
-    "q-bio.BM": "Biomolecules",
-    "q-bio.CB": "Cell Behavior",
-    "q-bio.GN": "Genomics",
-    "q-bio.MN": "Molecular Networks",
-    "q-bio.NC": "Neurons and Cognition",
-    "q-bio.OT": "Other Quantitative Biology",
-    "q-bio.PE": "Populations and Evolution",
-    "q-bio.QM": "Quantitative Methods",
-    "q-bio.SC": "Subcellular Processes",
-    "q-bio.TO": "Tissues and Organs",
-    
-    # Quantitative Finance
-    "q-fin.CP": "Computational Finance",
-    "q-fin.EC": "Economics",
-    "q-fin.GN": "General Finance",
-    "q-fin.MF": "Mathematical Finance",
-    "q-fin.PM": "Portfolio Management",
-    "q-fin.PR": "Pricing of Securities",
-    "q-fin.RM": "Risk Management",
-    "q-fin.ST": "Statistical Finance",
-    "q-fin.TR": "Trading and Market Microstructure",
-    
-    # Statistics
-    "stat.AP": "Applications",
-    "stat.CO": "Computation",
-    "stat.ME": "Methodology",
-    "stat.ML": "Machine Learning",
-    "stat.OT": "Other Statistics",
-    "stat.TH": "Statistics Theory"
-}
-
 # Use display names in the multiselect
 selected_display_names = st.multiselect("Categories", list(categories_dict.values()))
 
@@ -235,47 +62,83 @@ for display_name in selected_display_names:
             selected_cats.append(code)
             break
 
+page_size = st.selectbox("Results per page", [10, 25, 50])
+source = st.radio("Search in", [SEARCH_EVERYWHERE, SEARCH_LOCAL], horizontal=True)
+
 # Handle search button click
 if st.button("Search"):
     with st.spinner("Searching for papers..."):
         try:
-            papers = fetch_papers(search_query, selected_cats)
+            papers = fetch_papers(search_query, selected_cats, page_size, local_only=source == SEARCH_LOCAL)
 
             if not papers:
                 st.warning("No papers found. Try different search terms.")
         except Exception as e:
             st.error(f"Error: {e}")
 
+# Summarize every abstract on the page in one batched pass through the model
+if st.session_state.papers:
+    col1, col2 = st.columns([3, 1], vertical_alignment="bottom")
+    with col1:
+        all_length = st.slider("Summary Length(In percentage of original size)", 10, 100, key="all_summary_length")
+    with col2:
+        if st.button("Summarize all results", use_container_width=True):
+            with st.spinner("Generating abstract summaries..."):
+                summaries = summarize_abstracts([paper.summary for paper in st.session_state.papers], all_length)
+                st.session_state.abstract_summaries = {
+                    paper.entry_id: summary for paper, summary in zip(st.session_state.papers, summaries)
+                }
+
 # Create expander for each paper if papers are in session state
 if st.session_state.papers is not None:
+    local_ids = {paper.entry_id for paper in st.session_state.local_papers}
     for i, paper in enumerate(st.session_state.papers):
         with st.container(border=True):
             # Paper title
             st.header(paper.title)
+            if paper.entry_id in local_ids or isinstance(st.session_state.search_pager, LocalSearchPager):
+                st.caption("Already processed, opens instantly")
 
-            # Authors section
-            authors_text = ", ".join([a.name for a in paper.authors][:3])
-            if len(paper.authors) > 3:
-                authors_text += " et al."
-            st.markdown(f"**Authors:** *{authors_text}*")
+            # Authors section, display strings are built once when the paper is fetched
+            st.markdown(f"**Authors:** *{paper.authors_text}*")
 
             # Paper metadata
             col1, col2, col3 = st.columns([1, 1.5, 0.8])
 
             with col1:
-                st.markdown(
-                    f"**Published:** {paper.published.strftime('%Y-%m-%d')}")
+                st.markdown(f"**Published:** {paper.published}")
 
             with col2:
-                # Convert codes to display names
-                display_categories = [categories_dict.get(cat, cat) for cat in paper.categories]
-                categories_display = ", ".join(display_categories)
-                st.markdown(f"**Categories:** {categories_display}")
+                st.markdown(f"**Categories:** {paper.categories_text}")
 
             # View more button linking to paper details page
             with col3:
                 if st.button("View Details", key=f"view_{i}", use_container_width=True):
-                    st.session_state.abstract_summary = None
-                    st.session_state.paper_summary = None
                     show_paper_details(paper)
+
+            # Abstract summary from "Summarize all results"
+            if paper.entry_id in st.session_state.abstract_summaries:
+                st.markdown(f"**Abstract Summary:** {st.session_state.abstract_summaries[paper.entry_id]}")
+
+    # Page navigation, earlier pages are kept by the pager and later ones are fetched on demand
+    page_number = st.session_state.page_number
+    col1, col2, col3 = st.columns([1, 1, 1], vertical_alignment="center")
+    with col1:
+        if page_number > 0 and st.button("Previous page", use_container_width=True):
+            show_results_page(page_number - 1)
+            st.rerun()
+    with col2:
+        st.markdown(f"Page {page_number + 1}")
+    with col3:
+        if st.session_state.search_pager.has_page(page_number + 1) and st.button("Load more", use_container_width=True):
+            with st.spinner("Loading more papers..."):
+                try:
+                    if show_results_page(page_number + 1):
+                        st.rerun()
+                    # The next page turned out to be empty, stay on this one
+                    show_results_page(page_number)
+                    st.info("No more papers for this search.")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
 st.write("Thank you to arXiv for use of its open access interoperability.")
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app's modules live at the top level and the local stand-ins for arXiv and Gemini with the benchmarks
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    # Every test gets its own empty artifact cache
+    import paper_cache
+
+    monkeypatch.setattr(paper_cache, "CACHE_DIR", str(tmp_path / "papers"))
+    monkeypatch.setattr(paper_cache, "_usage", None)
+    return paper_cache.CACHE_DIR
+
+
+@pytest.fixture
+def genai_stub():
+    from stubs import start_genai_stub
+
+    server = start_genai_stub(first_token=0, chunk_delay=0)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def paper():
+    from paper_record import PaperRecord
+
+    return PaperRecord(
+        entry_id="http://arxiv.org/abs/2501.00001v1",
+        short_id="2501.00001v1",
+        title="A Test Paper",
+        summary="The abstract of a test paper.",
+        authors=["Ada Lovelace", "Alan Turing"],
+        published="2025-01-01",
+        categories=["cs.CL"],
+        pdf_url="http://127.0.0.1/pdf/2501.00001v1",
+    )
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("arxiv")
+pytest.importorskip("streamlit")
+
+import arxiv_service  # noqa: E402
+from metrics import start_trace  # noqa: E402
+from stubs import ArxivCorpus, count_requests, start_arxiv_stub  # noqa: E402
+
+
+@pytest.fixture
+def corpus():
+    return ArxivCorpus(size=12)
+
+
+@pytest.fixture
+def arxiv_stub(corpus):
+    server = start_arxiv_stub(corpus)
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def service(arxiv_stub, monkeypatch):
+    monkeypatch.setattr(arxiv_service, "ARXIV_API_URL", f"{arxiv_stub.base_url}/api/query")
+    monkeypatch.setattr(arxiv_service, "ARXIV_DELAY_SECONDS", 0)
+    return arxiv_service.ArxivService()
+
+
+def queries(server):
+    return count_requests(server, "GET", "/api/query")
+
+
+def test_search_is_served_from_the_cache_until_it_expires(service, arxiv_stub, monkeypatch):
+    monkeypatch.setattr(arxiv_service, "SEARCH_TTL_SECONDS", 0.5)
+    first = service.search("summarization", [], 5)
+    second = service.search("summarization", [], 5)
+    assert len(first) == 5
+    assert [paper.entry_id for paper in second] == [paper.entry_id for paper in first]
+    assert queries(arxiv_stub) == 1
+
+    time.sleep(0.6)
+    service.search("summarization", [], 5)
+    assert queries(arxiv_stub) == 2
+
+
+def test_identical_searches_in_flight_share_one_request(service, arxiv_stub):
+    arxiv_stub.latency = 0.5
+    start = threading.Barrier(2)
+    results = []
+    caches = []
+
+    def search():
+        trace = start_trace()
+        start.wait()
+        results.append(service.search("summarization", ["cs.CL"], 5))
+        caches.extend(event["cache"] for event in trace if event["stage"] == "search")
+
+    threads = [threading.Thread(target=search) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert queries(arxiv_stub) == 1
+    assert sorted(caches) == ["coalesced", "miss"]
+    assert [paper.entry_id for paper in results[0]] == [paper.entry_id for paper in results[1]]
+
+
+def test_search_keys_ignore_case_and_category_order(service, arxiv_stub):
+    assert arxiv_service.normalize_query("  Summarization AND  Transformers ") == "summarization AND transformers"
+
+    service.search("Summarization AND Transformers", ["cs.CL", "cs.AI"])
+    service.search("summarization AND transformers", ["cs.AI", "cs.CL", "cs.CL"])
+    assert queries(arxiv_stub) == 1
+
+    # arXiv's boolean operators are case sensitive, so a lowercase "and" is a different search
+    service.search("summarization and transformers", ["cs.AI", "cs.CL"])
+    assert queries(arxiv_stub) == 2
+
+
+def test_id_lookups_are_cached(service, arxiv_stub, corpus):
+    ids = corpus.ids()[:2]
+    papers = service.get_papers(ids)
+    assert [paper.short_id for paper in papers] == ids
+    assert [paper.short_id for paper in service.get_papers(ids)] == ids
+    assert queries(arxiv_stub) == 1
+
+    assert service.get_paper(ids[0]).short_id == ids[0]
+    assert service.get_paper(ids[0]).short_id == ids[0]
+    assert queries(arxiv_stub) == 2
+
+    with pytest.raises(LookupError):
+        service.get_paper("2501.99999v1")
+
+
+def test_pager_reads_pages_until_the_feed_ends(arxiv_stub, monkeypatch):
+    monkeypatch.setattr(arxiv_service, "ARXIV_API_URL", f"{arxiv_stub.base_url}/api/query")
+    monkeypatch.setattr(arxiv_service, "ARXIV_DELAY_SECONDS", 0)
+    arxiv_stub.corpus = ArxivCorpus(size=25)
+    pager = arxiv_service.ArxivService().paginate("summarization", [], page_size=10)
+
+    assert [len(pager.page(number)) for number in range(3)] == [10, 10, 5]
+    assert not pager.has_page(3)
+    assert pager.page(3) == []
+    assert queries(arxiv_stub) == 3
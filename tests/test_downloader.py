@@ -0,0 +1,154 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+requests = pytest.importorskip("requests")
+pytest.importorskip("streamlit")
+pytest.importorskip("pymupdf")
+
+import downloader  # noqa: E402
+from downloader import CHUNK_SIZE, META_SUFFIX, PART_SUFFIX, Downloader  # noqa: E402
+from stubs import ArxivCorpus, count_requests, start_arxiv_stub  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    # Long enough that every pdf spans several of the downloader's chunks, a generated page is about 1.5 KB
+    return ArxivCorpus(size=4, page_counts=(120, 160))
+
+
+@pytest.fixture
+def arxiv_stub(corpus):
+    server = start_arxiv_stub(corpus)
+    yield server
+    server.shutdown()
+
+
+def pdf_url(server, entry_id):
+    return f"{server.base_url}/pdf/{entry_id}"
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_cold_download_writes_the_file_and_its_validators(arxiv_stub, corpus, tmp_path):
+    entry_id = corpus.ids()[0]
+    data = corpus.pdf(entry_id)
+    path = str(tmp_path / "paper.pdf")
+
+    result = Downloader().download(pdf_url(arxiv_stub, entry_id), path)
+    assert result == {"changed": True, "bytes": len(data), "resumed": 0, "requests": 1}
+    assert read(path) == data
+    assert sorted(os.listdir(tmp_path)) == ["paper.pdf", "paper.pdf" + META_SUFFIX]
+    with open(path + META_SUFFIX, encoding="utf-8") as f:
+        meta = json.load(f)
+    assert meta["etag"] and meta["last_modified"]
+    assert meta["size"] == len(data)
+
+    # A file that is already there isn't requested again without revalidation
+    assert Downloader().download(pdf_url(arxiv_stub, entry_id), path)["requests"] == 0
+    assert count_requests(arxiv_stub, "GET", f"/pdf/{entry_id}") == 1
+
+
+def test_revalidation_only_downloads_changed_files(arxiv_stub, corpus, tmp_path):
+    entry_id = corpus.ids()[1]
+    url = pdf_url(arxiv_stub, entry_id)
+    path = str(tmp_path / "paper.pdf")
+    client = Downloader()
+    client.download(url, path)
+
+    # Unchanged, a conditional request confirms it
+    result = client.download(url, path, revalidate=True)
+    assert result == {"changed": False, "bytes": 0, "resumed": 0, "requests": 1}
+    assert count_requests(arxiv_stub, "HEAD", f"/pdf/{entry_id}") == 1
+    assert count_requests(arxiv_stub, "GET", f"/pdf/{entry_id}") == 1
+
+    # The server rebuilt the pdf, so it is downloaded again in full
+    rebuilt = corpus.pdf(entry_id) + b"\n% rebuilt\n"
+    corpus.pdfs[entry_id] = rebuilt
+    try:
+        result = client.download(url, path, revalidate=True)
+    finally:
+        corpus.pdfs.pop(entry_id)
+    assert result["changed"]
+    assert result["bytes"] == len(rebuilt)
+    assert read(path) == rebuilt
+
+
+def test_dropped_connection_is_resumed_with_a_range_request(corpus, tmp_path):
+    entry_id = corpus.ids()[2]
+    data = corpus.pdf(entry_id)
+    assert len(data) > 2 * CHUNK_SIZE
+    # Cut on a chunk boundary, the bytes of a chunk that was still being read when the connection dropped are lost
+    server = start_arxiv_stub(corpus, drop_after=CHUNK_SIZE)
+    try:
+        path = str(tmp_path / "paper.pdf")
+        result = Downloader().download(pdf_url(server, entry_id), path)
+        # The second request only asked for the rest of the file, so no byte was transferred twice
+        assert result == {"changed": True, "bytes": len(data), "resumed": 0, "requests": 2}
+        assert count_requests(server, "GET", f"/pdf/{entry_id}") == 2
+    finally:
+        server.shutdown()
+    assert read(path) == data
+    assert not os.path.exists(path + PART_SUFFIX)
+
+
+def test_download_cut_short_resumes_from_its_part_file_on_the_next_call(corpus, tmp_path, monkeypatch):
+    entry_id = corpus.ids()[2]
+    data = corpus.pdf(entry_id)
+    dropped = CHUNK_SIZE
+    assert len(data) > 2 * dropped
+    server = start_arxiv_stub(corpus, drop_after=dropped)
+    try:
+        url = pdf_url(server, entry_id)
+        path = str(tmp_path / "paper.pdf")
+        monkeypatch.setattr(downloader, "DOWNLOAD_ATTEMPTS", 1)
+        with pytest.raises(requests.RequestException):
+            Downloader().download(url, path)
+        assert os.path.getsize(path + PART_SUFFIX) == dropped
+        assert not os.path.exists(path)
+
+        result = Downloader().download(url, path)
+        assert result == {"changed": True, "bytes": len(data) - dropped, "resumed": dropped, "requests": 1}
+    finally:
+        server.shutdown()
+    assert read(path) == data
+
+
+def test_complete_part_file_is_finished_after_a_416(arxiv_stub, corpus, tmp_path):
+    # A part file that already has every byte, e.g. the process stopped before renaming it
+    entry_id = corpus.ids()[3]
+    data = corpus.pdf(entry_id)
+    url = pdf_url(arxiv_stub, entry_id)
+    first = str(tmp_path / "first.pdf")
+    Downloader().download(url, first)
+    path = str(tmp_path / "paper.pdf")
+    os.replace(first, path + PART_SUFFIX)
+    os.replace(first + META_SUFFIX, path + PART_SUFFIX + META_SUFFIX)
+
+    result = Downloader().download(url, path)
+    assert result == {"changed": True, "bytes": 0, "resumed": len(data), "requests": 1}
+    assert read(path) == data
+    assert sorted(os.listdir(tmp_path)) == ["paper.pdf", "paper.pdf" + META_SUFFIX]
+
+
+def test_bandwidth_limit_is_shared_by_every_download(arxiv_stub, corpus, tmp_path):
+    ids = corpus.ids()
+    total = sum(len(corpus.pdf(entry_id)) for entry_id in ids)
+    rate = total // 2
+    assert rate >= CHUNK_SIZE
+    client = Downloader(concurrency=4, bytes_per_second=rate)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(ids)) as pool:
+        list(pool.map(lambda entry_id: client.download(pdf_url(arxiv_stub, entry_id), str(tmp_path / entry_id)), ids))
+    elapsed = time.perf_counter() - start
+
+    # The bucket starts full with one second's worth of bytes, the rest has to wait for the rate
+    assert elapsed >= 0.9 * (total - rate) / rate
+    assert all(read(str(tmp_path / entry_id)) == corpus.pdf(entry_id) for entry_id in ids)
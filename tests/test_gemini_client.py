@@ -0,0 +1,107 @@
+import pytest
+
+pytest.importorskip("google.genai")
+pytest.importorskip("streamlit")
+
+import gemini_client  # noqa: E402
+from stubs import count_requests  # noqa: E402
+
+PAPER = "A paper long enough to be registered as a context. " * 100
+
+
+@pytest.fixture(autouse=True)
+def no_contexts(monkeypatch):
+    # Every test starts with no paper registered
+    monkeypatch.setattr(gemini_client, "_contexts", {})
+
+
+@pytest.fixture
+def client(genai_stub):
+    from google import genai
+    from google.genai import types
+
+    return genai.Client(api_key="test", http_options=types.HttpOptions(base_url=genai_stub.base_url))
+
+
+def creates(server):
+    return count_requests(server, "POST", "/cachedContents")
+
+
+def deletes(server):
+    return count_requests(server, "DELETE")
+
+
+def test_paper_is_registered_once_across_turns(client, genai_stub):
+    assert len(PAPER) >= gemini_client.MIN_CONTEXT_CHARS
+    session, other_session = {}, {}
+    gemini_client.hold_paper_context(client, session, "paper-a")
+    texts = []
+
+    def paper_text():
+        texts.append(PAPER)
+        return PAPER
+
+    names = [gemini_client.get_paper_context(client, "paper-a", paper_text) for _ in range(3)]
+    # Another session asking about the same paper shares the registered context
+    gemini_client.hold_paper_context(client, other_session, "paper-a")
+    names.append(gemini_client.get_paper_context(client, "paper-a", paper_text))
+
+    assert names[0] is not None
+    assert set(names) == {names[0]}
+    assert creates(genai_stub) == 1
+    assert len(texts) == 1
+
+
+def test_moving_to_another_paper_deletes_the_first_context(client, genai_stub):
+    session = {}
+    gemini_client.hold_paper_context(client, session, "paper-a")
+    first = gemini_client.get_paper_context(client, "paper-a", lambda: PAPER)
+
+    gemini_client.hold_paper_context(client, session, "paper-b")
+    assert deletes(genai_stub) == 1
+    second = gemini_client.get_paper_context(client, "paper-b", lambda: PAPER)
+    assert second != first
+    assert creates(genai_stub) == 2
+    assert session["paper_context"] == "paper-b"
+
+
+def test_context_is_kept_until_the_last_session_leaves(client, genai_stub):
+    session, other_session = {}, {}
+    gemini_client.hold_paper_context(client, session, "paper-a")
+    gemini_client.hold_paper_context(client, other_session, "paper-a")
+    gemini_client.get_paper_context(client, "paper-a", lambda: PAPER)
+
+    gemini_client.release_paper_context(client, session)
+    assert deletes(genai_stub) == 0
+    gemini_client.release_paper_context(client, other_session)
+    assert deletes(genai_stub) == 1
+
+    # Releasing again, e.g. on a second click of "Back to search", does nothing
+    gemini_client.release_paper_context(client, other_session)
+    assert deletes(genai_stub) == 1
+
+
+def test_short_papers_are_sent_inline(client, genai_stub):
+    assert gemini_client.get_paper_context(client, "short", lambda: "Too short to register.") is None
+    assert creates(genai_stub) == 0
+
+
+def test_failed_registration_falls_back_to_inline(client, genai_stub):
+    genai_stub.fail_contexts = True
+    assert gemini_client.get_paper_context(client, "paper-a", lambda: PAPER) is None
+    # The paper is sent inline until the context would have expired, rather than retrying on every request
+    assert gemini_client.get_paper_context(client, "paper-a", lambda: PAPER) is None
+    assert creates(genai_stub) == 1
+
+
+def test_context_is_registered_again_near_expiry(client, genai_stub, monkeypatch):
+    # A context that only lives as long as the renewal margin is due for renewal as soon as it is registered
+    monkeypatch.setattr(gemini_client, "CONTEXT_TTL_SECONDS", gemini_client.CONTEXT_RENEW_SECONDS)
+    first = gemini_client.get_paper_context(client, "paper-a", lambda: PAPER)
+    second = gemini_client.get_paper_context(client, "paper-a", lambda: PAPER)
+
+    assert first is not None and second is not None
+    assert second != first
+    assert creates(genai_stub) == 2
+    # The context about to expire is deleted rather than left to run out
+    assert deletes(genai_stub) == 1
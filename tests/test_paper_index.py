@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("requests")
+pytest.importorskip("streamlit")
+
+import paper_index  # noqa: E402
+from stubs import EMBEDDING_DIM, count_requests, start_genai_stub  # noqa: E402
+
+# Ten sections, each about a topic only it mentions
+MARKDOWN = "\n\n".join(
+    f"# Section {i}\n\nThis section is about topic{i}. " + f"topic{i} " * 5 + "\n\nThe results are discussed below."
+    for i in range(10)
+)
+
+
+@pytest.fixture
+def embedding_url(genai_stub, monkeypatch):
+    url = f"{genai_stub.base_url}/embed"
+    monkeypatch.setattr(paper_index, "EMBEDDING_URL", url)
+    return url
+
+
+def test_split_sections_labels_chunks_with_their_heading():
+    long_paragraphs = "\n\n".join(" ".join(["word"] * 40) for _ in range(3))
+    markdown = f"Preamble text.\n\n# Introduction\n\nFirst paragraph.\n\nSecond paragraph.\n\n## Method\n\n{long_paragraphs}"
+    chunks = paper_index.split_sections(markdown, max_words=100)
+
+    # Text before the first heading is a chunk of its own without a label
+    assert chunks[0] == "Preamble text."
+    assert chunks[1] == "## Introduction\n\nFirst paragraph.\n\nSecond paragraph."
+    # Three 40 word paragraphs don't fit in 100 words, so the section is split between paragraphs
+    # and both parts keep its heading
+    method = chunks[2:]
+    assert [chunk.count("\n\n") for chunk in method] == [2, 1]
+    assert all(chunk.startswith("## Method\n\n") for chunk in method)
+
+
+def test_split_sections_keeps_oversize_paragraphs_whole():
+    paragraph = " ".join(["word"] * 150)
+    assert paper_index.split_sections(f"# Results\n\n{paragraph}", max_words=100) == [f"## Results\n\n{paragraph}"]
+
+
+def test_index_is_saved_and_reloaded(cache_dir, genai_stub, embedding_url, paper):
+    chunks, embeddings = paper_index.get_index(paper, MARKDOWN)
+    assert chunks == paper_index.split_sections(MARKDOWN)
+    assert embeddings.shape == (len(chunks), EMBEDDING_DIM)
+
+    directory = os.path.join(cache_dir, paper.short_id)
+    with open(os.path.join(directory, paper_index.CHUNKS_NAME), encoding="utf-8") as f:
+        assert json.load(f) == {"model": embedding_url, "chunks": chunks}
+    assert np.array_equal(np.load(os.path.join(directory, paper_index.EMBEDDINGS_NAME)), embeddings)
+
+    # Asking again, e.g. from another process, loads the saved index without embedding anything
+    reloaded_chunks, reloaded = paper_index.get_index(paper, MARKDOWN)
+    assert reloaded_chunks == chunks
+    assert np.array_equal(reloaded, embeddings)
+    assert count_requests(genai_stub, "POST", "/embed") == 1
+
+
+def test_index_is_rebuilt_when_the_embedding_source_changes(cache_dir, genai_stub, embedding_url, paper, monkeypatch):
+    paper_index.get_index(paper, MARKDOWN)
+
+    other = start_genai_stub(first_token=0, chunk_delay=0)
+    try:
+        other_url = f"{other.base_url}/embed"
+        monkeypatch.setattr(paper_index, "EMBEDDING_URL", other_url)
+        chunks, _ = paper_index.get_index(paper, MARKDOWN)
+        assert count_requests(other, "POST", "/embed") == 1
+    finally:
+        other.shutdown()
+
+    with open(os.path.join(cache_dir, paper.short_id, paper_index.CHUNKS_NAME), encoding="utf-8") as f:
+        assert json.load(f) == {"model": other_url, "chunks": chunks}
+    assert count_requests(genai_stub, "POST", "/embed") == 1
+
+
+def test_top_chunks_returns_the_best_matches_in_paper_order(cache_dir, embedding_url, paper):
+    chunks = paper_index.split_sections(MARKDOWN)
+    assert len(chunks) == 10
+
+    best = paper_index.top_chunks(paper, MARKDOWN, "What about topic8, topic2 and topic5?", k=3)
+    assert best == [chunks[2], chunks[5], chunks[8]]
+
+
+def test_top_chunks_returns_every_chunk_of_a_short_paper(cache_dir, embedding_url, paper):
+    chunks = paper_index.split_sections(MARKDOWN)
+    assert paper_index.top_chunks(paper, MARKDOWN, "Anything?", k=len(chunks)) == chunks
@@ -0,0 +1,115 @@
+import threading
+
+from metrics import stage
+
+# Gemini 2.0 Flash input window, less room for the system instruction and the question
+GEMINI_INPUT_TOKEN_LIMIT = 1_048_576
+GEMINI_PROMPT_RESERVE = 8_192
+
+
+_punkt_lock = threading.Lock()
+_punkt_ready = False
+
+
+def ensure_sentence_tokenizer():
+    # Download nltk's sentence tokenizer data (if needed), only the first time it is used
+    global _punkt_ready
+    with _punkt_lock:
+        if _punkt_ready:
+            return
+        import nltk
+
+        try:
+            nltk.data.find("tokenizers/punkt_tab")
+        except LookupError:
+            nltk.download("punkt_tab")
+        _punkt_ready = True
+
+
+def split_sentences(text):
+    ensure_sentence_tokenizer()
+    from nltk import sent_tokenize
+
+    return sent_tokenize(text)
+
+
+def tokenizer_counter(tokenizer):
+    # Count tokens for a list of texts with a hugging face tokenizer, special tokens excluded
+    def count_tokens(texts):
+        return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)["input_ids"]]
+    return count_tokens
+
+
+def model_input_budget(tokenizer):
+    # Positions left for the text once the model's special tokens are added
+    return tokenizer.model_max_length - tokenizer.num_special_tokens_to_add()
+
+
+def fit_to_token_budget(text, budget, count_tokens, estimate_tokens=None, total=None):
+    # Keep as many whole sentences from the start of text as fit in budget tokens
+    # count_tokens gives exact counts for a list of texts, estimate_tokens can stand in for it
+    # when counting every sentence exactly would be too expensive
+    estimate_tokens = estimate_tokens or count_tokens
+    if total is None:
+        total = count_tokens([text])[0]
+    if total <= budget:
+        return text, total
+
+    sentences = split_sentences(text)
+    counts = estimate_tokens(sentences)
+    kept = 0
+    used = 0
+    for count in counts:
+        if used + count > budget:
+            break
+        kept += 1
+        used += count
+
+    # Counting sentences separately is off by a token or so at each join, so check the packed text
+    # and drop trailing sentences until the real count fits
+    while kept:
+        packed = " ".join(sentences[:kept])
+        total = count_tokens([packed])[0]
+        if total <= budget:
+            return packed, total
+        overshoot = total - budget
+        while kept and overshoot > 0:
+            kept -= 1
+            overshoot -= counts[kept]
+
+    # Not even the first sentence fits, fall back to cutting characters proportionally
+    packed = text
+    while total > budget:
+        packed = packed[: max(1, int(len(packed) * budget / total * 0.95))]
+        total = count_tokens([packed])[0]
+    return packed, total
+
+
+def summary_length_bounds(input_tokens, percent, padding=10, bucket=1):
+    # Convert a percentage of the input into min_length and max_length in tokens,
+    # padded in each direction to give the model some leeway in generating the summary
+    length = round(percent / 100 * input_tokens)
+    length = max(bucket, round(length / bucket) * bucket)
+    return max(0, length - padding), length + padding
+
+
+def fit_gemini_input(client, model, text, budget=GEMINI_INPUT_TOKEN_LIMIT - GEMINI_PROMPT_RESERVE):
+    # Tokens never outnumber characters, so most papers skip the count request entirely
+    if len(text) <= budget:
+        return text
+
+    def count_tokens(texts):
+        return [client.models.count_tokens(model=model, contents=t).total_tokens for t in texts]
+
+    with stage("tokenize", remote=True) as event:
+        # Only whole-text counts go to the API, sentences are estimated from the paper's tokens per character
+        total = count_tokens([text])[0]
+        event["tokens"] = total
+        if total <= budget:
+            return text
+        ratio = total / len(text)
+
+        def estimate_tokens(texts):
+            return [int(len(t) * ratio) + 1 for t in texts]
+
+        return fit_to_token_budget(text, budget, count_tokens, estimate_tokens, total=total)[0]
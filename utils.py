@@ -1,8 +1,96 @@
+import os
+import threading
+
 import streamlit as st
-from transformers import pipeline
+
+SUMMARIZER_MODEL = "sshleifer/distilbart-cnn-12-6"
+# Inference backend for the abstract summarizer, all of them keep the pipeline call contract
+# "pytorch" is the full precision model, "int8" applies dynamic int8 quantization to its linear layers,
+# "onnx" runs an ONNX Runtime export of the encoder and decoder (needs optimum[onnxruntime])
+SUMMARIZER_BACKENDS = ("pytorch", "int8", "onnx")
+SUMMARIZER_BACKEND = os.environ.get("PAPER_DISTILL_SUMMARIZER_BACKEND", "pytorch")
+# Where the ONNX export is kept so the sessions are only built from the exported graphs on later starts
+ONNX_EXPORT_DIR = os.environ.get(
+    "PAPER_DISTILL_ONNX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".onnx_models"),
+)
+
+
+def build_summarizer(backend):
+    # transformers pulls in torch, so it is only imported once a model is actually needed
+    from transformers import AutoTokenizer, pipeline
+
+    if backend == "pytorch":
+        return pipeline("summarization", model=SUMMARIZER_MODEL)
+
+    tokenizer = AutoTokenizer.from_pretrained(SUMMARIZER_MODEL)
+
+    if backend == "int8":
+        import torch
+        from transformers import AutoModelForSeq2SeqLM
+
+        model = AutoModelForSeq2SeqLM.from_pretrained(SUMMARIZER_MODEL)
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return pipeline("summarization", model=model, tokenizer=tokenizer)
+
+    if backend == "onnx":
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError as e:
+            raise ImportError("The onnx summarizer backend needs optimum[onnxruntime] to be installed") from e
+
+        export_dir = os.path.join(ONNX_EXPORT_DIR, SUMMARIZER_MODEL.replace("/", "--"))
+        if os.path.isdir(export_dir):
+            model = ORTModelForSeq2SeqLM.from_pretrained(export_dir)
+        else:
+            # Export once, later starts load the saved encoder and decoder graphs directly
+            model = ORTModelForSeq2SeqLM.from_pretrained(SUMMARIZER_MODEL, export=True)
+            model.save_pretrained(export_dir)
+            tokenizer.save_pretrained(export_dir)
+        return pipeline("summarization", model=model, tokenizer=tokenizer)
+
+    raise ValueError(f"Unknown summarizer backend {backend!r}, expected one of {', '.join(SUMMARIZER_BACKENDS)}")
+
 
 # Load model from hugging face
 @st.cache_resource
-def load_summarizer():
-    return pipeline("summarization", model="sshleifer/distilbart-cnn-12-6")
-summarizer = load_summarizer()
\ No newline at end of file
+def load_summarizer(backend=SUMMARIZER_BACKEND):
+    return build_summarizer(backend)
+
+
+# "warm" loads the heavy dependencies in a background thread right after start up,
+# "lazy" leaves each of them until it is first used
+STARTUP_MODE = os.environ.get("PAPER_DISTILL_STARTUP", "warm")
+
+
+def _warm_up():
+    # Everything here is also loaded on first use, warming up only moves the wait off the user's first click.
+    # A session that needs the model while this runs waits for this load rather than starting another
+    from token_budget import ensure_sentence_tokenizer
+
+    ensure_sentence_tokenizer()
+    import pymupdf4llm  # noqa: F401
+    from google import genai  # noqa: F401
+    load_summarizer()
+
+
+# Started once per process, shared by all sessions through the streamlit cache
+@st.cache_resource
+def start_warm_up():
+    if STARTUP_MODE != "warm":
+        return None
+    thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def show_paper_details(paper):
+    # Open paper on the details page, clearing what the session had for the paper it showed before.
+    # Jobs started for that paper keep running, but they are no longer polled or shown here
+    st.session_state.abstract_summary = None
+    st.session_state.paper_summary = None
+    st.session_state.paper_summary_job = None
+    st.session_state.answer = None
+    st.session_state.answer_job = None
+    st.session_state.selected_paper = paper
+    st.switch_page("paper_details_page.py")